@@ -4,6 +4,12 @@ from bot.client import Clients
 from bot.helpers.database import Database
 from bot.helpers.web import start_web_server, ping_server
 from bot.helpers.queue import queue_manager
+from bot.helpers.eta_model import eta_model
+from bot.helpers.api_stats import api_stats
+from bot.helpers.outbox import outbox
+from bot.helpers.capacity import capacity
+from bot.helpers.channel_manager import ChannelManager
+from bot.helpers.membership import membership
 from bot.utils.logger import LOGGER
 from pyrogram import idle
 
@@ -13,8 +19,9 @@ async def main():
         # Validate configuration
         Config.validate()
         LOGGER.info("✅ Environment variables validated")
-        LOGGER.info(f"🛡️ Safety delays: {Config.SYNC_ACTION_DELAY}s between bots, {Config.SYNC_CHANNEL_DELAY}s between channels")
+        LOGGER.info(f"🛡️ Safety delays: {Config.HELPER_WRITE_RATE}/s helper admin writes, {Config.HELPER_JOIN_INTERVAL}s between joins, {Config.SYNC_CHANNEL_DELAY}s between sync channels")
         LOGGER.info(f"📊 Max helper user channels: {Config.MAX_USER_CHANNELS} (spam protection)")
+        LOGGER.info(f"👷 Queue workers: {Config.QUEUE_WORKERS} (helper write burst {Config.HELPER_WRITE_BURST})")
         
         # Initialize Pyrogram clients FIRST
         Clients.initialize()
@@ -26,6 +33,8 @@ async def main():
         
         # Initialize database
         await Database.initialize()
+        await eta_model.load()
+        await capacity.load()
         
         # Start web server for health checks
         await start_web_server()
@@ -48,8 +57,14 @@ async def main():
         await Clients.get_helper_username()
         
         # Start background tasks
-        asyncio.create_task(queue_manager.worker())
+        queue_manager.start_workers()
         asyncio.create_task(ping_server())
+        asyncio.create_task(api_stats.flusher())
+        asyncio.create_task(outbox.sender())
+        asyncio.create_task(capacity.reconciler())
+        asyncio.create_task(ChannelManager.headroom_maintainer())
+        membership.register()
+        asyncio.create_task(membership.sweeper())
         # Send restart notification if this was a restart
         from bot.modules.restart import send_restart_notification
         asyncio.create_task(send_restart_notification())        
@@ -85,8 +100,9 @@ async def main():
         except Exception as e:
             LOGGER.error(f"Error stopping user session: {e}")
         
-        # Close database
+        # Close database (after saving the last API stats)
         try:
+            await api_stats.flush()
             Database.close()
         except Exception as e:
             LOGGER.error(f"Error closing database: {e}")
@@ -1,7 +1,64 @@
+import asyncio
+import time
 from pyrogram import Client
+from pyrogram.errors import FloodWait
 from config import Config
+from bot.helpers.rate_limiter import rate_limiter, classify, query_name, BOT, HELPER
+from bot.helpers.api_stats import api_stats, find_caller
+from bot.helpers.metrics import FLOOD_WAIT_SECONDS
 from bot.utils.logger import LOGGER
 
+class ManagedClient(Client):
+    """
+    Pyrogram client whose every RPC passes through the shared rate limiter.
+    - Waits for the budget of the call's method class before sending.
+    - A FloodWait pauses that class for all callers; short ones are retried here.
+    - Every attempt is recorded in api_stats (latency, errors, FloodWaits, caller).
+    """
+    def __init__(self, *args, limiter_key, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter_key = limiter_key
+
+    async def invoke(self, query, *args, **kwargs):
+        # Handle FloodWait here (not inside the session) so every one is seen
+        if len(args) >= 3:
+            args, threshold = args[:2], args[2]
+        else:
+            threshold = kwargs.pop("sleep_threshold", None)
+        if threshold is None:
+            threshold = self.sleep_threshold
+        
+        method_class = classify(query)
+        method = query_name(query)
+        caller = find_caller()
+        while True:
+            await rate_limiter.acquire(self.limiter_key, method_class)
+            started = time.monotonic()
+            try:
+                result = await super().invoke(query, *args, sleep_threshold=0, **kwargs)
+                api_stats.record(self.limiter_key, method, caller, time.monotonic() - started)
+                return result
+            except FloodWait as e:
+                api_stats.record(
+                    self.limiter_key, method, caller, time.monotonic() - started,
+                    error="FloodWait", flood_wait=e.value
+                )
+                FLOOD_WAIT_SECONDS.inc(e.value, client=self.limiter_key)
+                rate_limiter.pause(self.limiter_key, method_class, e.value)
+                if e.value > threshold:
+                    raise
+                LOGGER.info(f"⏳ [{self.limiter_key}] FloodWait {e.value}s on {method}, retrying")
+                if rate_limiter.bucket(self.limiter_key, method_class) is None:
+                    # No bucket (unlimited class, or an interval set to 0)
+                    # to hold the retry back, so wait here
+                    await asyncio.sleep(e.value)
+            except Exception as e:
+                api_stats.record(
+                    self.limiter_key, method, caller, time.monotonic() - started,
+                    error=type(e).__name__
+                )
+                raise
+
 class Clients:
     bot = None
     user_app = None
@@ -11,15 +68,17 @@ class Clients:
     @staticmethod
     def initialize():
         """Initialize Pyrogram clients"""
-        Clients.bot = Client(
+        Clients.bot = ManagedClient(
             "bot_client",
+            limiter_key=BOT,
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
             bot_token=Config.BOT_TOKEN,
             in_memory=True
         )
-        Clients.user_app = Client(
+        Clients.user_app = ManagedClient(
             "user_client",
+            limiter_key=HELPER,
             api_id=Config.API_ID,
             api_hash=Config.API_HASH,
             session_string=Config.USER_SESSION,
@@ -0,0 +1,154 @@
+from datetime import datetime
+from pyrogram.raw import functions, types
+from bot.client import Clients
+from bot.helpers.database import Database
+from config import Config
+from bot.utils.logger import LOGGER
+
+MASK_64 = (1 << 64) - 1
+# Channels cap admins well below this, so one page is the whole list
+ADMIN_PAGE = 200
+# A snapshot carried by a queued task is reused as-is for this long,
+# after that it is revalidated (cheap "not modified" if unchanged)
+SNAPSHOT_REUSE = 300
+
+def participants_hash(user_ids):
+    """Telegram's 64-bit list hash over participant ids (signed, as sent)"""
+    h = 0
+    for user_id in user_ids:
+        h ^= h >> 21
+        h ^= (h << 35) & MASK_64
+        h ^= h >> 4
+        h = (h + user_id) & MASK_64
+    return h - (1 << 64) if h >= 1 << 63 else h
+
+class AdminSnapshot:
+    """
+    One channel's admin list at a point in time.
+    - admins: [{"id", "username" (lowercase), "is_bot", "is_owner"}]
+    - Fetched once per setup flow and carried through the queue job.
+    """
+    def __init__(self, chat_id, admins, participants_hash=0, verified_at=None):
+        self.chat_id = chat_id
+        self.admins = admins
+        self.hash = participants_hash
+        self.verified_at = verified_at or datetime.utcnow()
+
+    @classmethod
+    def from_doc(cls, doc):
+        if not doc:
+            return None
+        return cls(doc["channel_id"], doc.get("admins", []), doc.get("hash", 0), doc.get("verified_at"))
+
+    def to_doc(self):
+        return {
+            "channel_id": self.chat_id,
+            "admins": self.admins,
+            "hash": self.hash,
+            "verified_at": self.verified_at,
+        }
+
+    @property
+    def count(self):
+        return len(self.admins)
+
+    @property
+    def owner_id(self):
+        for admin in self.admins:
+            if admin.get("is_owner"):
+                return admin["id"]
+        return None
+
+    def usernames(self, bots_only=False):
+        """Lowercase admin usernames"""
+        return {
+            admin["username"] for admin in self.admins
+            if admin.get("username") and (admin.get("is_bot") or not bots_only)
+        }
+
+    def age(self):
+        return (datetime.utcnow() - self.verified_at).total_seconds()
+
+    def is_fresh(self, ttl=None):
+        ttl = Config.ADMIN_SNAPSHOT_TTL if ttl is None else ttl
+        return self.age() < ttl
+
+class AdminCache:
+    """
+    Per-channel admin snapshots (Bot reads, stored in `admin_snapshots`).
+    - fetch() sends the stored participants hash, so an unchanged admin
+      list costs a tiny "not modified" reply instead of a full download.
+    - get() returns the stored snapshot without any Telegram call.
+    """
+    @staticmethod
+    async def get(chat_id):
+        return AdminSnapshot.from_doc(await Database.get_admin_snapshot(chat_id))
+
+    @staticmethod
+    async def fetch(chat_id, snapshot=None):
+        """
+        Current admin snapshot, revalidated against Telegram.
+        - `snapshot`: one already in hand (skips the DB read).
+        - Returns None if the admin list could not be read.
+        """
+        if snapshot is None:
+            snapshot = await AdminCache.get(chat_id)
+        # Snapshots from before owner tracking must be re-downloaded once
+        if snapshot and snapshot.owner_id is None:
+            snapshot = None
+        try:
+            peer = await Clients.bot.resolve_peer(chat_id)
+            result = await Clients.bot.invoke(
+                functions.channels.GetParticipants(
+                    channel=types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash),
+                    filter=types.ChannelParticipantsAdmins(),
+                    offset=0,
+                    limit=ADMIN_PAGE,
+                    hash=snapshot.hash if snapshot else 0,
+                )
+            )
+        except Exception as e:
+            LOGGER.warning(f"[ADMIN_CACHE] Could not fetch admins for {chat_id}: {e}")
+            return None
+
+        if isinstance(result, types.channels.ChannelParticipantsNotModified):
+            await Database.touch_admin_snapshot(chat_id)
+            snapshot.verified_at = datetime.utcnow()
+            return snapshot
+
+        users = {user.id: user for user in result.users}
+        admins = []
+        for participant in result.participants:
+            user = users.get(participant.user_id)
+            admins.append({
+                "id": participant.user_id,
+                "username": user.username.lower() if user and user.username else None,
+                "is_bot": bool(user and user.bot),
+                "is_owner": isinstance(participant, types.ChannelParticipantCreator),
+            })
+
+        snapshot = AdminSnapshot(chat_id, admins, participants_hash([a["id"] for a in admins]))
+        await Database.save_admin_snapshot(chat_id, admins, snapshot.hash)
+        return snapshot
+
+    @staticmethod
+    async def current(chat_id):
+        """Stored snapshot while fresh (ADMIN_SNAPSHOT_TTL), otherwise fetch()"""
+        snapshot = await AdminCache.get(chat_id)
+        if snapshot and snapshot.owner_id is not None and snapshot.is_fresh():
+            return snapshot
+        return await AdminCache.fetch(chat_id, snapshot)
+
+    @staticmethod
+    async def reuse(snapshot, chat_id):
+        """A carried snapshot, revalidated only if older than SNAPSHOT_REUSE"""
+        if snapshot and snapshot.age() < SNAPSHOT_REUSE:
+            return snapshot
+        return await AdminCache.fetch(chat_id, snapshot)
+
+    @staticmethod
+    async def invalidate(chat_id):
+        """Forget a channel's snapshot (after we changed its admins)"""
+        await Database.delete_admin_snapshot(chat_id)
+
+admin_cache = AdminCache()
@@ -0,0 +1,90 @@
+import asyncio
+import sys
+from datetime import datetime
+from bot.helpers.database import Database
+from bot.utils.logger import LOGGER
+
+# Latency histogram upper bounds (seconds); last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FLUSH_INTERVAL = 60
+
+# Frames from these modules are plumbing, not the caller we want to blame
+SKIP_MODULES = ("bot.client", "bot.helpers.api_stats", "bot.helpers.rate_limiter")
+
+def find_caller():
+    """Module name of the first bot.* frame outside the client plumbing"""
+    frame = sys._getframe(2)
+    while frame:
+        module = frame.f_globals.get("__name__", "")
+        if (module.startswith("bot.") or module == "__main__") and module not in SKIP_MODULES:
+            return module
+        frame = frame.f_back
+    return "pyrogram"
+
+def _new_entry():
+    return {
+        "count": 0,
+        "errors": 0,
+        "flood_waits": 0,
+        "flood_seconds": 0,
+        "total_time": 0.0,
+        "max_time": 0.0,
+        "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+class ApiStats:
+    """
+    In-memory counters for every Telegram RPC, rolled up into Mongo each minute.
+    - Keyed by (client, raw method, caller module).
+    - Tracks count, latency histogram, errors and FloodWait tallies.
+    """
+    def __init__(self):
+        self.current = {}
+
+    def record(self, client, method, caller, duration, error=None, flood_wait=0):
+        entry = self.current.get((client, method, caller))
+        if entry is None:
+            entry = self.current[(client, method, caller)] = _new_entry()
+        entry["count"] += 1
+        entry["total_time"] += duration
+        entry["max_time"] = max(entry["max_time"], duration)
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                entry["buckets"][index] += 1
+                break
+        else:
+            entry["buckets"][-1] += 1
+        if error:
+            entry["errors"] += 1
+        if flood_wait:
+            entry["flood_waits"] += 1
+            entry["flood_seconds"] += flood_wait
+
+    async def flush(self):
+        """Write the counters of the current minute to Mongo and reset them"""
+        if not self.current:
+            return
+        pending, self.current = self.current, {}
+        minute = datetime.utcnow().replace(second=0, microsecond=0)
+        docs = [
+            {"minute": minute, "client": client, "method": method, "caller": caller, **entry}
+            for (client, method, caller), entry in pending.items()
+        ]
+        await Database.insert_api_stats(docs)
+
+    async def flusher(self):
+        """Background task: roll up counters every minute"""
+        LOGGER.info("✅ API stats flusher started")
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                LOGGER.error(f"API stats flush failed: {e}")
+
+    async def top_calls(self, window, sort_field, limit=5):
+        """Top (client, method) rows by `sort_field` over the last `window`"""
+        await self.flush()
+        return await Database.aggregate_api_stats(datetime.utcnow() - window, sort_field, limit)
+
+api_stats = ApiStats()
@@ -1,7 +1,7 @@
 import asyncio
 import time
 from pyrogram.types import ChatPrivileges
-from pyrogram.enums import ChatMemberStatus, ChatMembersFilter
+from pyrogram.enums import ChatMemberStatus
 from pyrogram.errors import (
     FloodWait, 
     ChatAdminRequired, 
@@ -10,16 +10,26 @@ from pyrogram.errors import (
     UserNotParticipant
 )
 from bot.client import Clients
-from config import Config
+from bot.helpers.admin_cache import admin_cache
 from bot.utils.logger import LOGGER
 
 class BotManager:
     @staticmethod
-    async def process_bots(chat_id, action, bots_list, status_msg=None):
+    async def get_admin_usernames(chat_id):
+        """Lowercase usernames of current admins (BOT read, saves Userbot limits)"""
+        # Revalidated with the stored participants hash: unchanged lists cost ~nothing
+        snapshot = await admin_cache.fetch(chat_id)
+        existing_admins = snapshot.usernames() if snapshot else set()
+        LOGGER.info(f"[BOT_MANAGER] Found {len(existing_admins)} existing admins.")
+        return existing_admins
+
+    @staticmethod
+    async def process_bots(chat_id, action, bots_list, status_msg=None, existing_admins=None):
         """
         Add/Remove bots using Hybrid Approach:
         - READ (Fetch Admins): Done by BOT (Save User limits)
         - WRITE (Add/Promote): Done by USERBOT (Bot API restrictions)
+        - `existing_admins`: admin usernames already fetched by the caller (skips the read)
         """
         if not bots_list:
             return [], []
@@ -34,19 +44,13 @@ class BotManager:
         
         # --- OPTIMIZATION: Fetch existing admins using BOT client ---
         # We offload this 'Read' operation to the Bot to save Userbot limits
-        existing_admins = set()
-        if action == "add":
-            try:
-                LOGGER.info(f"[BOT_MANAGER] Fetching existing admins (via Bot)...")
-                async for member in Clients.bot.get_chat_members(chat_id, filter=ChatMembersFilter.ADMINISTRATORS):
-                    if member.user and member.user.username:
-                        existing_admins.add(member.user.username.lower())
-                LOGGER.info(f"[BOT_MANAGER] Found {len(existing_admins)} existing admins.")
-            except Exception as e:
-                LOGGER.warning(f"[BOT_MANAGER] Could not fetch admins: {e}")
+        if existing_admins is None:
+            existing_admins = set()
+            if action == "add":
+                existing_admins = await BotManager.get_admin_usernames(chat_id)
         # -------------------------------------------------------------
 
-        LOGGER.info(f"[BOT_MANAGER] Processing {len(bots_list)} bots with {Config.SYNC_ACTION_DELAY}s delay")
+        LOGGER.info(f"[BOT_MANAGER] Processing {len(bots_list)} bots (paced by the helper promote budget)")
         
         last_update_time = 0
         
@@ -74,75 +78,73 @@ class BotManager:
             # ------------------------
 
             # 2. Process Bot (Using USERBOT)
-            delay_applied = False
-            
-            try:
-                if action == "add":
-                    LOGGER.info(f"[BOT_MANAGER] [{i+1}/{len(bots_list)}] Adding {username}")
-                    
-                    # Step A: Try Adding (Must be Userbot)
-                    try:
-                        await Clients.user_app.add_chat_members(chat_id, username)
-                        await asyncio.sleep(0.5)
-                    except UserAlreadyParticipant:
-                        pass
-                    except Exception as e:
-                        LOGGER.debug(f"Add member failed ({username}): {e}")
-
-                    # Step B: Try Promoting (Must be Userbot)
-                    max_retries = 6
-                    for attempt in range(max_retries):
-                        try:
-                            await Clients.user_app.promote_chat_member(
-                                chat_id, 
-                                username, 
-                                privileges=privileges
-                            )
-                            success.append(username)
-                            LOGGER.info(f"[BOT_MANAGER] ✅ {username} promoted")
-                            break # Success
-                            
-                        except RightForbidden:
-                            # 403: Bot likely already admin (protected)
-                            success.append(username)
-                            break
-                            
-                        except ChatAdminRequired:
-                            # 400: Helper not recognized as admin yet
-                            if attempt < max_retries - 1:
-                                LOGGER.warning(f"[BOT_MANAGER] 🔄 ChatAdminRequired, retrying... ({attempt+1}/{max_retries})")
-                                await asyncio.sleep(5)
-                            else:
-                                LOGGER.error(f"[BOT_MANAGER] ❌ Failed {username} after retries")
-                                failed.append(username)
-                        
-                        except FloodWait as fw:
-                            LOGGER.warning(f"[BOT_MANAGER] ⏳ FloodWait {fw.value}s")
-                            await asyncio.sleep(fw.value + 2)
-                            delay_applied = True
-                            
-                        except Exception as e:
-                            LOGGER.error(f"[BOT_MANAGER] ❌ Error {username}: {e}")
-                            failed.append(username)
-                            break
+            # Pacing + FloodWait pauses come from the shared rate limiter
+            if action == "add":
+                LOGGER.info(f"[BOT_MANAGER] [{i+1}/{len(bots_list)}] Adding {username}")
+                
+                # Step A: Try Adding (Must be Userbot)
+                try:
+                    await Clients.user_app.add_chat_members(chat_id, username)
+                    await asyncio.sleep(0.5)
+                except UserAlreadyParticipant:
+                    pass
+                except Exception as e:
+                    LOGGER.debug(f"Add member failed ({username}): {e}")
 
-                elif action == "remove":
-                    LOGGER.info(f"[BOT_MANAGER] Removing {username}")
+                # Step B: Try Promoting (Must be Userbot)
+                max_retries = 6
+                for attempt in range(max_retries):
                     try:
                         await Clients.user_app.promote_chat_member(
-                            chat_id, username, privileges=ChatPrivileges()
+                            chat_id, 
+                            username, 
+                            privileges=privileges
                         )
-                        await Clients.user_app.ban_chat_member(chat_id, username)
-                        await Clients.user_app.unban_chat_member(chat_id, username)
                         success.append(username)
-                        LOGGER.info(f"[BOT_MANAGER] ✅ {username} removed")
+                        LOGGER.info(f"[BOT_MANAGER] ✅ {username} promoted")
+                        break # Success
+                        
+                    except RightForbidden:
+                        # 403: Bot likely already admin (protected)
+                        success.append(username)
+                        break
+                        
+                    except ChatAdminRequired:
+                        # 400: Helper not recognized as admin yet
+                        if attempt < max_retries - 1:
+                            LOGGER.warning(f"[BOT_MANAGER] 🔄 ChatAdminRequired, retrying... ({attempt+1}/{max_retries})")
+                            await asyncio.sleep(5)
+                        else:
+                            LOGGER.error(f"[BOT_MANAGER] ❌ Failed {username} after retries")
+                            failed.append(username)
+                    
+                    except FloodWait as fw:
+                        # The limiter already paused promotes; next attempt waits it out
+                        LOGGER.warning(f"[BOT_MANAGER] ⏳ FloodWait {fw.value}s, retrying after pause")
+                        if attempt == max_retries - 1:
+                            failed.append(username)
+                        
                     except Exception as e:
-                        LOGGER.error(f"Remove failed {username}: {e}")
+                        LOGGER.error(f"[BOT_MANAGER] ❌ Error {username}: {e}")
                         failed.append(username)
+                        break
+
+            elif action == "remove":
+                LOGGER.info(f"[BOT_MANAGER] Removing {username}")
+                try:
+                    await Clients.user_app.promote_chat_member(
+                        chat_id, username, privileges=ChatPrivileges()
+                    )
+                    await Clients.user_app.ban_chat_member(chat_id, username)
+                    await Clients.user_app.unban_chat_member(chat_id, username)
+                    success.append(username)
+                    LOGGER.info(f"[BOT_MANAGER] ✅ {username} removed")
+                except Exception as e:
+                    LOGGER.error(f"Remove failed {username}: {e}")
+                    failed.append(username)
 
-            finally:
-                # Safety Delay
-                if not delay_applied and i < len(bots_list) - 1:
-                    await asyncio.sleep(Config.SYNC_ACTION_DELAY)
+        # Admin list changed: next read must be a full fetch
+        if success or failed:
+            await admin_cache.invalidate(chat_id)
 
         return success, failed
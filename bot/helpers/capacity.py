@@ -0,0 +1,137 @@
+import asyncio
+import heapq
+from datetime import datetime
+from bot.helpers.database import Database
+from bot.helpers.eviction import MemberStats, get_policy
+from bot.helpers.metrics import HELPER_MEMBERSHIPS
+from config import Config
+from bot.utils.logger import LOGGER
+
+# Seconds between background reconciliations with Mongo
+CAPACITY_RECONCILE = 600
+
+class CapacityManager:
+    """
+    In-memory view of the helper's channel memberships.
+    - members: chat_id -> MemberStats, so limit checks are local.
+    - A min-heap keyed by the eviction policy (EVICTION_POLICY) gives the
+      next candidate in O(log n); stale entries are dropped lazily.
+    - Loaded at startup, updated on every join/leave/helper work,
+      reconciled with Mongo in the background.
+    """
+    def __init__(self):
+        self.members = {}
+        self._heap = []
+        self._version = 0
+        self.loaded = False
+        self.policy_name = Config.EVICTION_POLICY
+        self.key = get_policy(self.policy_name)
+
+    @property
+    def count(self):
+        return len(self.members)
+
+    @property
+    def free(self):
+        return Config.MAX_USER_CHANNELS - self.count
+
+    def has_room(self):
+        return self.count < Config.MAX_USER_CHANNELS
+
+    def _push(self, chat_id, stats):
+        heapq.heappush(self._heap, (self.key(stats), chat_id))
+
+    def _rebuild(self, docs):
+        self.members = {doc["channel_id"]: MemberStats.from_doc(doc) for doc in docs}
+        self._heap = [(self.key(stats), chat_id) for chat_id, stats in self.members.items()]
+        heapq.heapify(self._heap)
+        HELPER_MEMBERSHIPS.set(self.count)
+
+    async def load(self):
+        docs = await Database.get_member_channels()
+        if docs is None:
+            return
+        self._rebuild(docs)
+        self.loaded = True
+        LOGGER.info(
+            f"📦 Capacity loaded: {self.count}/{Config.MAX_USER_CHANNELS} helper memberships "
+            f"(eviction policy: {self.policy_name})"
+        )
+
+    async def joined(self, chat_id, doc=None, cost=None):
+        """Helper joined `chat_id`; `doc` holds its stored stats fields"""
+        self._version += 1
+        stats = MemberStats.from_doc(doc or {})
+        self.members[chat_id] = stats
+        self._push(chat_id, stats)
+        HELPER_MEMBERSHIPS.set(self.count)
+        await Database.log_membership_event(chat_id, "join", cost=cost)
+
+    async def left(self, chat_id, reason="leave"):
+        """Helper left `chat_id` (reason "evict" for auto-cleanup)"""
+        self._version += 1
+        self.members.pop(chat_id, None)
+        HELPER_MEMBERSHIPS.set(self.count)
+        await Database.log_membership_event(chat_id, "leave", reason=reason)
+
+    async def used(self, chat_id):
+        """The helper did work in `chat_id` (feeds LRU / LFU / cost)"""
+        now = datetime.utcnow()
+        stats = self.members.get(chat_id)
+        if stats is None:
+            stats = MemberStats(joined_at=now)
+        old_key = self.key(stats)
+        stats.used(now)
+        if chat_id in self.members and self.key(stats) != old_key:
+            self._push(chat_id, stats)
+        await Database.record_helper_work(chat_id, now, stats.heat)
+        await Database.log_membership_event(chat_id, "work")
+
+    async def pick_eviction(self, exclude=(), accept=None):
+        """
+        Lowest-scoring member channel not in `exclude` (None if all are protected).
+        - `accept(chat_id)`: optional async check a candidate must pass.
+        """
+        skipped = []
+        picked = None
+        try:
+            while self._heap:
+                key, chat_id = heapq.heappop(self._heap)
+                stats = self.members.get(chat_id)
+                if stats is None or self.key(stats) != key:
+                    continue  # left or re-scored since this entry was pushed
+                skipped.append((key, chat_id))
+                if chat_id in exclude:
+                    continue
+                if accept and not await accept(chat_id):
+                    continue
+                picked = chat_id
+                break
+        finally:
+            # Candidates stay members until their leave is recorded
+            for entry in skipped:
+                heapq.heappush(self._heap, entry)
+        return picked
+
+    async def reconcile(self):
+        """Replace the in-memory view with Mongo's (skipped if it moved meanwhile)"""
+        version = self._version
+        docs = await Database.get_member_channels()
+        if docs is None or version != self._version:
+            return
+        drift = set(self.members) ^ {doc["channel_id"] for doc in docs}
+        if drift:
+            LOGGER.warning(f"📦 Capacity drift on {len(drift)} channel(s), resynced from DB")
+        self._rebuild(docs)
+        self.loaded = True
+
+    async def reconciler(self):
+        """Background task: periodic reconciliation"""
+        while True:
+            await asyncio.sleep(CAPACITY_RECONCILE)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                LOGGER.error(f"Capacity reconcile error: {e}")
+
+capacity = CapacityManager()
@@ -1,8 +1,12 @@
 import asyncio
-from pyrogram import enums
+import time
+from datetime import datetime
+from pyrogram import utils
+from pyrogram.raw import functions, types
 from pyrogram.errors import (
     UserAlreadyParticipant, 
     InviteHashExpired, 
+    InviteHashInvalid,
     UsernameInvalid,
     FloodWait,
     UserNotParticipant,
@@ -12,24 +16,252 @@ from pyrogram.errors import (
 )
 from bot.client import Clients
 from bot.helpers.database import Database
+from bot.helpers.locks import channel_locks
+from bot.helpers.capacity import capacity
+from bot.helpers.outbox import outbox
+from bot.helpers.invite_cache import invite_cache
+from bot.helpers.membership import membership
+from bot.helpers.queue import queue_manager
 from config import Config
 from bot.utils.logger import LOGGER
 
+# Headroom maintainer: check period, and seconds without a foreground
+# join before the bot counts as idle
+HEADROOM_INTERVAL = 60
+HEADROOM_IDLE = 120
+# Seconds cached media counts stay valid for eviction reports
+MEDIA_COUNTS_TTL = 24 * 3600
+# Max seconds a leave waits for the media counts request (needs membership)
+EVICTION_COUNTS_WAIT = 5
+
 class ChannelManager:
     
-    # GLOBAL SET: Stores IDs of channels currently being set up.
-    # Used to pause Sync tasks and protect channels from auto-cleanup.
-    ACTIVE_SETUPS = set()
+    # BOTS_TO_ADD of a running /sync. While set, auto-cleanup only evicts
+    # channels already in sync, never ones the run still has to visit.
+    SYNC_WANTED = None
     
+    # Serializes the limit check + cleanup + join, so parallel queue
+    # workers cannot overshoot MAX_USER_CHANNELS or evict the same channel.
+    _capacity_lock = asyncio.Lock()
+
+    # Monotonic time of the last foreground join (headroom idle timer)
+    _last_join = 0.0
+
+    # Eviction reports still being built (keeps the tasks referenced)
+    _reports = set()
+
     @staticmethod
     async def check_helper_membership(chat_id):
-        """Check if helper is part of the chat"""
+        """Check if helper is part of the chat (membership index, RPC before its first sweep)"""
+        known = membership.is_member(chat_id)
+        if known is not None:
+            return known
         try:
             await Clients.user_app.get_chat_member(chat_id, "me")
             return True
         except:
             return False
 
+    @staticmethod
+    async def find_dead_channels(chat_ids):
+        """
+        Batched existence check (Bot, one channels.GetChannels per batch).
+        - Returns the ids the bot can no longer see (deleted/banned/invalid).
+        - A batch rejected because of one bad id is split to isolate it.
+        - Unexpected errors count as alive (never delete on doubt).
+        """
+        chat_ids = list(chat_ids)
+        if not chat_ids:
+            return set()
+        try:
+            result = await Clients.bot.invoke(
+                functions.channels.GetChannels(id=[
+                    # Bots may address channels they belong to with access_hash=0
+                    types.InputChannel(channel_id=utils.get_channel_id(chat_id), access_hash=0)
+                    for chat_id in chat_ids
+                ])
+            )
+        except (ChannelInvalid, ChannelPrivate, PeerIdInvalid):
+            if len(chat_ids) == 1:
+                return set(chat_ids)
+            mid = len(chat_ids) // 2
+            return (
+                await ChannelManager.find_dead_channels(chat_ids[:mid])
+                | await ChannelManager.find_dead_channels(chat_ids[mid:])
+            )
+        except Exception as e:
+            LOGGER.warning(f"Liveness check failed for {len(chat_ids)} channels: {e}")
+            return set()
+        
+        alive = {
+            utils.get_channel_id(chat.id) for chat in result.chats
+            if isinstance(chat, types.Channel)
+        }
+        return set(chat_ids) - alive
+
+    @staticmethod
+    async def _evict_one(exclude=(), reason="Limit Reached"):
+        """
+        Leave one channel picked by the eviction policy (call with _capacity_lock held).
+        - Never touches locked channels, `exclude`, or (during /sync) channels
+          the run still has to visit.
+        - Returns the channel left, None if every member is protected.
+        """
+        current_count = capacity.count
+        # Locked channels = running setups/queue tasks and the channel sync is working on
+        exclusions = channel_locks.locked_ids() | set(exclude)
+
+        accept = None
+        if ChannelManager.SYNC_WANTED is not None:
+            wanted = ChannelManager.SYNC_WANTED
+            accept = lambda cid: Database.is_channel_in_sync(cid, wanted)
+
+        old_id = await capacity.pick_eviction(exclude=exclusions, accept=accept)
+        if not old_id:
+            return None
+
+        # --- MEDIA COUNTS (Userbot, needs membership so it starts before the leave) ---
+        counts = asyncio.create_task(ChannelManager.get_media_counts(old_id))
+        await asyncio.wait({counts}, timeout=EVICTION_COUNTS_WAIT)
+
+        # --- LEAVE CHANNEL ---
+        try:
+            await Clients.user_app.leave_chat(old_id)
+            LOGGER.info(f"✅ Left {old_id}")
+        except (UserNotParticipant, ChannelInvalid, PeerIdInvalid, ChannelPrivate):
+            LOGGER.info(f"⚠️ Already left/invalid {old_id}")
+        except FloodWait as e:
+            # Rate limiter pauses all join/leave calls for this long
+            LOGGER.warning(f"⏳ FloodWait during leave: {e.value}s")
+        except Exception as e:
+            LOGGER.error(f"❌ Unknown error leaving {old_id}: {e}")
+
+        # CRITICAL: Update DB
+        # (Spacing before the next join comes from the join/leave budget)
+        await ChannelManager.mark_helper_left(old_id, reason="evict")
+
+        # --- NOTIFY BOT OWNER (background, never delays the next join) ---
+        report = asyncio.create_task(
+            ChannelManager._report_eviction(old_id, counts, current_count, reason)
+        )
+        ChannelManager._reports.add(report)
+        report.add_done_callback(ChannelManager._reports.discard)
+        return old_id
+
+    @staticmethod
+    async def get_media_counts(chat_id):
+        """
+        (videos, documents) of a channel, "N/A" where unknown.
+        - Served from the channel doc while younger than MEDIA_COUNTS_TTL.
+        - Otherwise one messages.GetSearchCounters for both filters (Userbot).
+        """
+        cached = await Database.get_media_counts(chat_id)
+        if cached and (datetime.utcnow() - cached["counted_at"]).total_seconds() < MEDIA_COUNTS_TTL:
+            return cached["videos"], cached["documents"]
+
+        try:
+            counters = await Clients.user_app.invoke(
+                functions.messages.GetSearchCounters(
+                    peer=await Clients.user_app.resolve_peer(chat_id),
+                    filters=[types.InputMessagesFilterVideo(), types.InputMessagesFilterDocument()],
+                )
+            )
+        except Exception as e:
+            LOGGER.warning(f"[DEBUG] Search counters failed for {chat_id}: {e}")
+            if cached:
+                return cached["videos"], cached["documents"]
+            return "N/A", "N/A"
+
+        by_filter = {type(counter.filter): counter.count for counter in counters}
+        videos = by_filter.get(types.InputMessagesFilterVideo, "N/A")
+        documents = by_filter.get(types.InputMessagesFilterDocument, "N/A")
+        await Database.save_media_counts(chat_id, videos, documents)
+        return videos, documents
+
+    @staticmethod
+    async def _report_eviction(old_id, counts, current_count, reason):
+        """Build the auto-cleanup report (bot reads in parallel) and queue it in the outbox"""
+        chat_info, invite, media = await asyncio.gather(
+            Clients.bot.get_chat(old_id),
+            invite_cache.get(old_id),
+            counts,
+            return_exceptions=True,
+        )
+        chat_title = getattr(chat_info, "title", None) or "Unknown/Deleted"
+        invite_back = invite if isinstance(invite, str) else "Unavailable"
+        video_count, doc_count = media if isinstance(media, tuple) else ("N/A", "N/A")
+        for error in (chat_info, invite):
+            if isinstance(error, Exception):
+                LOGGER.warning(f"[DEBUG] Bot failed to fetch info for {old_id}: {error}")
+
+        try:
+            await outbox.send(
+                Config.OWNER_ID,
+                f"🗑 **Auto-Cleanup Notification**\n\n"
+                f"⚠️ **{reason}:** `{current_count}/{Config.MAX_USER_CHANNELS}`\n"
+                f"♻️ **Leaving Channel** (policy: `{capacity.policy_name}`):\n"
+                f"📌 Name: **{chat_title}**\n"
+                f"🆔 ID: `{old_id}`\n\n"
+                f"📊 **Stats:**\n"
+                f"🎥 Videos: `{video_count}`\n"
+                f"📂 Documents: `{doc_count}`\n\n"
+                f"🔗 **Backdoor Link:**\n{invite_back}"
+            )
+        except Exception as e:
+            LOGGER.error(f"Eviction report for {old_id} failed: {e}")
+
+    @staticmethod
+    def _is_idle():
+        """No setup/queue/sync activity and no foreground join for HEADROOM_IDLE"""
+        return (
+            not channel_locks.locked_ids()
+            and not queue_manager.tasks
+            and ChannelManager.SYNC_WANTED is None
+            and not ChannelManager._capacity_lock.locked()
+            and time.monotonic() - ChannelManager._last_join >= HEADROOM_IDLE
+        )
+
+    @staticmethod
+    async def headroom_maintainer():
+        """
+        Background task: keep CAPACITY_HEADROOM free helper slots.
+        - Evicts one channel at a time, only while the bot is idle, so
+          setups almost never pay eviction latency themselves.
+        - The capacity lock is released between evictions; a setup that
+          arrives meanwhile goes first.
+        """
+        LOGGER.info(f"🧹 Headroom maintainer started (target: {Config.CAPACITY_HEADROOM} free slots)")
+        while True:
+            await asyncio.sleep(HEADROOM_INTERVAL)
+            try:
+                while capacity.free < Config.CAPACITY_HEADROOM and ChannelManager._is_idle():
+                    async with ChannelManager._capacity_lock:
+                        if capacity.free >= Config.CAPACITY_HEADROOM:
+                            break
+                        old_id = await ChannelManager._evict_one(reason="Headroom Below Target")
+                    if not old_id:
+                        LOGGER.info("🧹 Headroom: no eligible channel to leave, retrying later")
+                        break
+                    LOGGER.info(f"🧹 Headroom: {capacity.free}/{Config.CAPACITY_HEADROOM} free slots")
+            except Exception as e:
+                LOGGER.error(f"Headroom maintainer error: {e}")
+
+    @staticmethod
+    async def mark_helper_left(chat_id, reason="leave"):
+        """Record a helper leave everywhere (DB flag, capacity, membership index)"""
+        membership.left(chat_id)
+        await Database.update_channel_membership(chat_id, False)
+        await capacity.left(chat_id, reason=reason)
+
+    @staticmethod
+    async def _join_via(invite_link):
+        """Join with the helper account (already being a member is fine)"""
+        target = invite_link if "+" in invite_link else invite_link.split("/")[-1]
+        try:
+            await Clients.user_app.join_chat(target)
+        except UserAlreadyParticipant:
+            pass
+
     @staticmethod
     async def add_helper_to_channel(chat_id, status_message=None):
         """
@@ -39,100 +271,39 @@ class ChannelManager:
         - Max 3 Retries.
         - PROTECTS active setups from cleanup.
         """
+        async with ChannelManager._capacity_lock:
+            try:
+                await ChannelManager._add_helper_locked(chat_id, status_message)
+            finally:
+                ChannelManager._last_join = time.monotonic()
+
+    @staticmethod
+    async def _add_helper_locked(chat_id, status_message=None):
+        """add_helper_to_channel body, called with _capacity_lock held"""
         
         # =================================================================
         # 1. CLEANUP LOOP (Max 3 Retries)
         # =================================================================
+        # Normally a no-op: the headroom maintainer keeps free slots ready.
         
         max_retries = 3
         retry_count = 0
 
         while retry_count < max_retries:
-            current_count = await Database.get_active_channel_count()
+            # In-memory count (capacity manager), no Mongo round trip
+            current_count = capacity.count
             
             # If under limit, we are good to go
-            if current_count < Config.MAX_USER_CHANNELS:
+            if capacity.has_room():
                 break
             
             LOGGER.info(f"⚠️ Limit Hit: ({current_count}/{Config.MAX_USER_CHANNELS}). Attempting cleanup...")
             
             try:
-                # --- BUILD EXCLUSION LIST ---
-                # Exclude the channel we are trying to join + all currently active setups
-                exclusions = list(ChannelManager.ACTIVE_SETUPS)
-                if chat_id not in exclusions:
-                    exclusions.append(chat_id)
-
-                oldest_channel = await Database.get_oldest_channel(exclude_ids=exclusions)
-                
-                if not oldest_channel:
+                old_id = await ChannelManager._evict_one(exclude={chat_id}, reason="Limit Reached")
+                if not old_id:
                     LOGGER.warning("🚨 Limit reached but NO eligible channel to leave (All active/protected)! Proceeding anyway.")
                     break
-
-                old_id = oldest_channel.get("channel_id")
-                
-                # --- HYBRID DATA GATHERING ---
-                video_count = "N/A"
-                doc_count = "N/A"
-                chat_title = "Unknown/Deleted"
-                invite_back = "Unavailable"
-
-                # 1. FETCH STATS (Userbot)
-                try:
-                    video_count = await Clients.user_app.search_messages_count(
-                        chat_id=old_id, filter=enums.MessagesFilter.VIDEO
-                    )
-                except Exception: pass
-
-                try:
-                    doc_count = await Clients.user_app.search_messages_count(
-                        chat_id=old_id, filter=enums.MessagesFilter.DOCUMENT
-                    )
-                except Exception: pass
-
-                # 2. FETCH ADMIN INFO (Bot)
-                try:
-                    chat_info = await Clients.bot.get_chat(old_id)
-                    chat_title = chat_info.title
-                    invite_back = await Clients.bot.export_chat_invite_link(old_id)
-                except Exception as e:
-                    LOGGER.warning(f"[DEBUG] Bot failed to fetch info for {old_id}: {e}")
-
-                # --- NOTIFY BOT OWNER ---
-                try:
-                    await Clients.bot.send_message(
-                        Config.OWNER_ID,
-                        f"🗑 **Auto-Cleanup Notification**\n\n"
-                        f"⚠️ **Limit Reached:** `{current_count}/{Config.MAX_USER_CHANNELS}`\n"
-                        f"♻️ **Leaving Oldest Channel:**\n"
-                        f"📌 Name: **{chat_title}**\n"
-                        f"🆔 ID: `{old_id}`\n\n"
-                        f"📊 **Stats:**\n"
-                        f"🎥 Videos: `{video_count}`\n"
-                        f"📂 Documents: `{doc_count}`\n\n"
-                        f"🔗 **Backdoor Link:**\n{invite_back}"
-                    )
-                except Exception as e:
-                    LOGGER.error(f"Failed to send notification to Owner: {e}")
-
-                # --- LEAVE CHANNEL ---
-                try:
-                    await Clients.user_app.leave_chat(old_id)
-                    LOGGER.info(f"✅ Left {old_id}")
-                except (UserNotParticipant, ChannelInvalid, PeerIdInvalid, ChannelPrivate):
-                    LOGGER.info(f"⚠️ Already left/invalid {old_id}")
-                except FloodWait as e:
-                    LOGGER.warning(f"⏳ FloodWait during leave: {e.value}s")
-                    await asyncio.sleep(e.value)
-                except Exception as e:
-                    LOGGER.error(f"❌ Unknown error leaving {old_id}: {e}")
-                
-                # CRITICAL: Update DB
-                await Database.update_channel_membership(old_id, False)
-                
-                LOGGER.info("⏳ Cooling down 10s...")
-                await asyncio.sleep(10)
-                
             except Exception as e:
                 LOGGER.error(f"❌ Cleanup Loop Error: {e}")
                 break
@@ -143,22 +314,25 @@ class ChannelManager:
         # 2. JOIN NEW CHANNEL
         # =================================================================
         invite_link = None
+        join_started = time.monotonic()
         try:
-            invite_link = await Clients.bot.export_chat_invite_link(chat_id)
+            # Cached link: no export (and no primary link revoke) per join
+            invite_link = await invite_cache.get(chat_id)
         except Exception as e:
             LOGGER.error(f"Failed to create invite link: {e}")
             raise e
 
         try:
-            if "+" in invite_link:
-                try: await Clients.user_app.join_chat(invite_link)
-                except UserAlreadyParticipant: pass
-            else:
-                hash_part = invite_link.split("/")[-1]
-                try: await Clients.user_app.join_chat(hash_part)
-                except UserAlreadyParticipant: pass
+            try:
+                await ChannelManager._join_via(invite_link)
+            except (InviteHashExpired, InviteHashInvalid):
+                LOGGER.info(f"🔗 Cached invite link for {chat_id} is dead, creating a new one")
+                await invite_cache.invalidate(chat_id)
+                invite_link = await invite_cache.refresh(chat_id)
+                await ChannelManager._join_via(invite_link)
             
             LOGGER.info(f"✅ Helper joined {chat_id}")
+            membership.joined(chat_id)
             
             try:
                 bot_me = await Clients.bot.get_chat_member(chat_id, "me")
@@ -171,13 +345,15 @@ class ChannelManager:
             except Exception as e:
                 LOGGER.warning(f"Failed to promote helper: {e}")
 
-            await Database.update_channel_membership(chat_id, True, joined_at=None)
+            # Measured join cost feeds the cost-aware eviction policy
+            rejoin_cost = round(time.monotonic() - join_started, 1)
+            doc = await Database.update_channel_membership(chat_id, True, joined_at=None, rejoin_cost=rejoin_cost)
+            await capacity.joined(chat_id, doc, cost=rejoin_cost)
 
         except FloodWait as e:
             LOGGER.warning(f"FloodWait joining {chat_id}: {e.value}s")
             if status_message:
-                await status_message.edit(f"⏳ **Rate Limited.** Waiting {e.value}s...")
-            await asyncio.sleep(e.value)
+                await status_message.edit(f"⏳ **Rate Limited.** Helper joins paused for {e.value}s...")
             raise e
         except Exception as e:
             LOGGER.error(f"Failed to join {chat_id}: {e}")
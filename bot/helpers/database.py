@@ -1,24 +1,71 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+from pymongo import UpdateOne, UpdateMany, ReturnDocument
+from pymongo.errors import CursorNotFound
 from datetime import datetime
 from config import Config
+from bot.helpers.metrics import MONGO_LATENCY, HELPER_MEMBERSHIPS
 from bot.utils.logger import LOGGER
 
+class MongoLatencyListener(monitoring.CommandListener):
+    """Feeds MongoDB command latencies into the in-memory metrics"""
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome="ok")
+
+    def failed(self, event):
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, command=event.command_name, outcome="error")
+
 class Database:
     client = None
     db = None
     channels = None
     archive_channels = None
+    queue_jobs = None
+    task_stats = None
+    api_stats = None
+    sync_jobs = None
+    sync_outcomes = None
+    outbox = None
+    admin_snapshots = None
+    membership_events = None
+    invite_links = None
     
+    # Channel fields the capacity manager / eviction policies use
+    MEMBER_STATS_FIELDS = {
+        "_id": 0, "channel_id": 1, "user_joined_at": 1, "last_helper_work": 1,
+        "helper_work_count": 1, "helper_heat": 1, "rejoin_cost": 1,
+    }
+
     @staticmethod
     async def initialize():
         """Initialize MongoDB connection"""
-        Database.client = AsyncIOMotorClient(Config.MONGO_URL)
+        Database.client = AsyncIOMotorClient(Config.MONGO_URL, event_listeners=[MongoLatencyListener()])
         Database.db = Database.client["linkerx_db"]
         
         # 1. Main Collection
         Database.channels = Database.db["channels"]
         # 2. Archive Collection
         Database.archive_channels = Database.db["archive_channels"]
+        # 3. Queue Jobs (one document per queued/running task)
+        Database.queue_jobs = Database.db["queue_jobs"]
+        # 4. Task Duration Stats (queue ETA model)
+        Database.task_stats = Database.db["task_stats"]
+        # 5. Telegram RPC stats (per-minute rollups)
+        Database.api_stats = Database.db["api_stats"]
+        # 6. Sync Runs (/sync, /syncarchive checkpoints + per-channel outcomes)
+        Database.sync_jobs = Database.db["sync_jobs"]
+        Database.sync_outcomes = Database.db["sync_outcomes"]
+        # 7. Notification Outbox (owner DMs sent by the background sender)
+        Database.outbox = Database.db["outbox"]
+        # 8. Admin Snapshots (per-channel admin list + participants hash)
+        Database.admin_snapshots = Database.db["admin_snapshots"]
+        # 9. Membership History (joins / helper work / leaves, for /evictsim)
+        Database.membership_events = Database.db["membership_events"]
+        # 10. Invite Links (helper join link per channel, reused until it fails)
+        Database.invite_links = Database.db["invite_links"]
         
         # Indexes for Main
         try:
@@ -39,6 +86,50 @@ class Database:
         except Exception as e:
             LOGGER.error(f"❌ Archive Database index error: {e}")
 
+        # Indexes for Queue Jobs
+        try:
+            await Database.queue_jobs.create_index("enqueued_at")
+        except Exception as e:
+            LOGGER.error(f"❌ Queue Jobs index error: {e}")
+
+        # Indexes for API Stats (rollups expire after 2 days)
+        try:
+            await Database.api_stats.create_index("minute", expireAfterSeconds=2 * 24 * 3600)
+        except Exception as e:
+            LOGGER.error(f"❌ API Stats index error: {e}")
+
+        # Indexes for Sync Runs (outcomes expire after 7 days)
+        try:
+            await Database.sync_jobs.create_index("status")
+            await Database.sync_outcomes.create_index([("job_id", 1), ("channel_id", 1)], unique=True)
+            await Database.sync_outcomes.create_index("at", expireAfterSeconds=7 * 24 * 3600)
+        except Exception as e:
+            LOGGER.error(f"❌ Sync Jobs index error: {e}")
+
+        # Indexes for Outbox
+        try:
+            await Database.outbox.create_index([("next_at", 1), ("created_at", 1)])
+        except Exception as e:
+            LOGGER.error(f"❌ Outbox index error: {e}")
+
+        # Indexes for Admin Snapshots
+        try:
+            await Database.admin_snapshots.create_index("channel_id", unique=True)
+        except Exception as e:
+            LOGGER.error(f"❌ Admin Snapshots index error: {e}")
+
+        # Indexes for Membership History (kept 90 days)
+        try:
+            await Database.membership_events.create_index("at", expireAfterSeconds=90 * 24 * 3600)
+        except Exception as e:
+            LOGGER.error(f"❌ Membership History index error: {e}")
+
+        # Indexes for Invite Links
+        try:
+            await Database.invite_links.create_index("channel_id", unique=True)
+        except Exception as e:
+            LOGGER.error(f"❌ Invite Links index error: {e}")
+
     # =================================================================
     #  MAIN DATABASE METHODS
     # =================================================================
@@ -55,39 +146,76 @@ class Database:
     @staticmethod
     async def get_active_channel_count():
         try:
-            return await Database.channels.count_documents({"user_is_member": True})
+            count = await Database.channels.count_documents({"user_is_member": True})
+            HELPER_MEMBERSHIPS.set(count)
+            return count
         except Exception as e:
             LOGGER.error(f"Error counting active channels: {e}")
             return 0
     
     @staticmethod
-    async def get_oldest_channel(exclude_ids=None):
-        """
-        Get oldest active channel, excluding a LIST of IDs.
-        Changed from exclude_id (single) to exclude_ids (list).
-        """
-        query = {"user_is_member": True}
-        
-        if exclude_ids:
-            # Ensure it is a list and not empty
-            if isinstance(exclude_ids, list) and len(exclude_ids) > 0:
-                query["channel_id"] = {"$nin": exclude_ids}
-            elif isinstance(exclude_ids, int):
-                # Fallback for legacy calls if any
-                query["channel_id"] = {"$ne": exclude_ids}
-        
-        cursor = Database.channels.find(query).sort("user_joined_at", 1).limit(1)
-        result = await cursor.to_list(length=1)
-        return result[0] if result else None
-    
+    def _drift_pipeline(wanted):
+        """Aggregation stages matching channels whose installed_bots != wanted"""
+        wanted = list(wanted)
+        return [
+            {"$project": {
+                "_id": 0, "channel_id": 1, "owner_id": 1, "installed_bots": 1, "user_is_member": 1,
+                "drift": {"$let": {
+                    "vars": {"have": {"$ifNull": ["$installed_bots", []]}},
+                    "in": {"$or": [
+                        {"$gt": [{"$size": {"$setDifference": [wanted, "$$have"]}}, 0]},
+                        {"$gt": [{"$size": {"$setDifference": ["$$have", wanted]}}, 0]},
+                    ]},
+                }},
+            }},
+            {"$match": {"drift": True}},
+            {"$project": {"drift": 0}},
+        ]
+
     @staticmethod
-    async def get_all_channels():
+    async def count_channels_needing_sync(wanted):
         try:
-            return await Database.channels.find({}).to_list(length=None)
+            pipeline = Database._drift_pipeline(wanted) + [{"$count": "n"}]
+            result = await Database.channels.aggregate(pipeline).to_list(length=1)
+            return result[0]["n"] if result else 0
         except Exception as e:
-            LOGGER.error(f"Error getting all channels: {e}")
-            return []
-    
+            LOGGER.error(f"Error counting channels needing sync: {e}")
+            return 0
+
+    @staticmethod
+    async def iter_channels_needing_sync(wanted, after=None, member=None):
+        """
+        Stream channels whose bot set differs from `wanted`.
+        - Filtered server-side with $setDifference; only the fields sync uses.
+        - Yields one document at a time (memory stays flat).
+        - `after` resumes the stream past a checkpointed channel_id.
+        - `member` True/False keeps only channels the helper is / isn't in.
+        - Mongo errors other than an expired cursor are raised.
+        """
+        last_id = after
+        while True:
+            # Sorted by channel_id so an expired idle cursor can resume after last_id
+            pipeline = [{"$sort": {"channel_id": 1}}]
+            match = {}
+            if last_id is not None:
+                match["channel_id"] = {"$gt": last_id}
+            if member is not None:
+                match["user_is_member"] = True if member else {"$ne": True}
+            if match:
+                pipeline.insert(0, {"$match": match})
+            try:
+                cursor = Database.channels.aggregate(pipeline + Database._drift_pipeline(wanted), batchSize=100)
+                async for doc in cursor:
+                    last_id = doc["channel_id"]
+                    yield doc
+                return
+            except CursorNotFound:
+                LOGGER.warning(f"Sync cursor expired after {last_id}, resuming...")
+            except Exception as e:
+                # Not an end of stream: the run must fail and resume from its cursor
+                LOGGER.error(f"Error streaming channels for sync: {e}")
+                raise
+
     @staticmethod
     async def get_user_channels(owner_id):
         try:
@@ -98,18 +226,126 @@ class Database:
             return []
     
     @staticmethod
-    async def update_channel_membership(chat_id, is_member, joined_at=None):
+    async def update_channel_membership(chat_id, is_member, joined_at=None, rejoin_cost=None):
+        """Returns the channel's eviction stats fields (same round trip)"""
         update_data = {"user_is_member": is_member}
         if joined_at:
             update_data["user_joined_at"] = joined_at
+        if rejoin_cost:
+            update_data["rejoin_cost"] = rejoin_cost
         if not is_member:
             update_data["user_left_at"] = datetime.utcnow()
         
-        await Database.channels.update_one(
+        doc = await Database.channels.find_one_and_update(
             {"channel_id": chat_id},
             {"$set": update_data},
-            upsert=True
+            projection=Database.MEMBER_STATS_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        return doc or {}
+
+    @staticmethod
+    async def get_member_channels():
+        """Eviction stats of every channel the helper is in"""
+        try:
+            cursor = Database.channels.find({"user_is_member": True}, Database.MEMBER_STATS_FIELDS)
+            return await cursor.to_list(length=None)
+        except Exception as e:
+            LOGGER.error(f"Error loading member channels: {e}")
+            return None
+
+    @staticmethod
+    async def correct_membership(member_ids):
+        """
+        Align user_is_member with the helper's real channels (one bulk write).
+        - member_ids: every channel the helper is in (dialog sweep).
+        - Returns the number of channel docs corrected, None on error.
+        """
+        member_ids = list(member_ids)
+        try:
+            result = await Database.channels.bulk_write([
+                UpdateMany(
+                    {"user_is_member": True, "channel_id": {"$nin": member_ids}},
+                    {"$set": {"user_is_member": False, "user_left_at": datetime.utcnow()}}
+                ),
+                UpdateMany(
+                    {"user_is_member": {"$ne": True}, "channel_id": {"$in": member_ids}},
+                    {"$set": {"user_is_member": True}}
+                ),
+            ], ordered=False)
+            return result.modified_count
+        except Exception as e:
+            LOGGER.error(f"Error correcting helper membership: {e}")
+            return None
+
+    @staticmethod
+    async def record_helper_work(chat_id, at, heat):
+        """The helper did work in this channel (LRU/LFU/cost inputs)"""
+        try:
+            await Database.channels.update_one(
+                {"channel_id": chat_id},
+                {"$set": {"last_helper_work": at, "helper_heat": heat}, "$inc": {"helper_work_count": 1}}
+            )
+        except Exception as e:
+            LOGGER.error(f"Error recording helper work for {chat_id}: {e}")
+
+    @staticmethod
+    async def get_media_counts(chat_id):
+        """Cached {"videos", "documents", "counted_at"} of a channel (None if never counted)"""
+        try:
+            doc = await Database.channels.find_one({"channel_id": chat_id}, {"media_counts": 1})
+            return (doc or {}).get("media_counts")
+        except Exception as e:
+            LOGGER.error(f"Error reading media counts for {chat_id}: {e}")
+            return None
+
+    @staticmethod
+    async def save_media_counts(chat_id, videos, documents):
+        try:
+            await Database.channels.update_one(
+                {"channel_id": chat_id},
+                {"$set": {"media_counts": {
+                    "videos": videos,
+                    "documents": documents,
+                    "counted_at": datetime.utcnow(),
+                }}}
+            )
+        except Exception as e:
+            LOGGER.error(f"Error saving media counts for {chat_id}: {e}")
+
+    @staticmethod
+    async def log_membership_event(chat_id, event, reason=None, cost=None):
+        """Append to the membership history replayed by /evictsim"""
+        try:
+            await Database.membership_events.insert_one({
+                "channel_id": chat_id,
+                "event": event,
+                "reason": reason,
+                "cost": cost,
+                "at": datetime.utcnow(),
+            })
+        except Exception as e:
+            LOGGER.error(f"Error logging membership event for {chat_id}: {e}")
+
+    @staticmethod
+    async def iter_membership_events(since=None):
+        """Membership history, oldest first"""
+        query = {"at": {"$gte": since}} if since else {}
+        async for doc in Database.membership_events.find(query, {"_id": 0}).sort("at", 1):
+            yield doc
+
+    @staticmethod
+    async def is_channel_in_sync(chat_id, wanted):
+        """True if installed_bots already equals `wanted`"""
+        try:
+            doc = await Database.channels.find_one({
+                "channel_id": chat_id,
+                "$expr": {"$setEquals": [{"$ifNull": ["$installed_bots", []]}, list(wanted)]},
+            }, {"_id": 1})
+            return doc is not None
+        except Exception:
+            return False
     
     @staticmethod
     async def save_setup(chat_id, owner_id, installed_bots):
@@ -220,29 +456,364 @@ class Database:
             return None
 
     @staticmethod
-    async def get_all_archive_channels():
+    async def delete_archive_channels(chat_ids):
+        """Remove many archive channels in one write, returns deleted count"""
+        try:
+            result = await Database.archive_channels.delete_many({"channel_id": {"$in": list(chat_ids)}})
+            return result.deleted_count
+        except Exception as e:
+            LOGGER.error(f"Error deleting archive channels: {e}")
+            return 0
+
+    @staticmethod
+    async def count_archive_channels():
+        try:
+            return await Database.archive_channels.count_documents({})
+        except Exception as e:
+            LOGGER.error(f"Error counting archive channels: {e}")
+            return 0
+
+    @staticmethod
+    async def iter_archive_channels(after=None):
+        """Stream archive channel ids (projection only, no full documents)"""
+        last_id = after
+        while True:
+            query = {} if last_id is None else {"channel_id": {"$gt": last_id}}
+            try:
+                cursor = Database.archive_channels.find(
+                    query, {"_id": 0, "channel_id": 1}
+                ).sort("channel_id", 1).batch_size(100)
+                async for doc in cursor:
+                    last_id = doc["channel_id"]
+                    yield doc
+                return
+            except CursorNotFound:
+                LOGGER.warning(f"Archive cursor expired after {last_id}, resuming...")
+            except Exception as e:
+                # Not an end of stream: the run must fail and resume from its cursor
+                LOGGER.error(f"Error streaming archive channels: {e}")
+                raise
+
+    # =================================================================
+    #  SYNC JOB METHODS
+    # =================================================================
+
+    @staticmethod
+    async def create_sync_job(kind, chat_id, total):
+        """Start a persisted /sync or /syncarchive run, returns its id"""
+        try:
+            result = await Database.sync_jobs.insert_one({
+                "kind": kind,
+                "status": "running",
+                "chat_id": chat_id,
+                "total": total,
+                "cursor": None,
+                "counts": {},
+                "started_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            })
+            return result.inserted_id
+        except Exception as e:
+            LOGGER.error(f"Error creating sync job: {e}")
+            return None
+
+    @staticmethod
+    async def get_running_sync_jobs(kind=None):
+        try:
+            query = {"status": "running"}
+            if kind:
+                query["kind"] = kind
+            return await Database.sync_jobs.find(query).to_list(length=None)
+        except Exception as e:
+            LOGGER.error(f"Error getting running sync jobs: {e}")
+            return []
+
+    @staticmethod
+    async def update_sync_job(job_id, fields):
+        try:
+            fields["updated_at"] = datetime.utcnow()
+            await Database.sync_jobs.update_one({"_id": job_id}, {"$set": fields})
+        except Exception as e:
+            LOGGER.error(f"Error updating sync job {job_id}: {e}")
+
+    @staticmethod
+    async def save_sync_outcome(job_id, channel_id, outcome, error=None):
+        try:
+            await Database.sync_outcomes.update_one(
+                {"job_id": job_id, "channel_id": channel_id},
+                {"$set": {"outcome": outcome, "error": error, "at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            LOGGER.error(f"Error saving sync outcome for {channel_id}: {e}")
+
+    @staticmethod
+    async def save_sync_outcomes(job_id, channel_ids, outcome):
+        """Same outcome for many channels in one bulk write"""
+        if not channel_ids:
+            return
+        try:
+            now = datetime.utcnow()
+            await Database.sync_outcomes.bulk_write([
+                UpdateOne(
+                    {"job_id": job_id, "channel_id": channel_id},
+                    {"$set": {"outcome": outcome, "error": None, "at": now}},
+                    upsert=True
+                )
+                for channel_id in channel_ids
+            ], ordered=False)
+        except Exception as e:
+            LOGGER.error(f"Error saving {len(channel_ids)} sync outcomes: {e}")
+
+    @staticmethod
+    async def get_sync_outcome_ids(job_id, after=None):
+        """Channel ids already finished by this run (past the checkpoint)"""
+        try:
+            query = {"job_id": job_id}
+            if after is not None:
+                query["channel_id"] = {"$gt": after}
+            cursor = Database.sync_outcomes.find(query, {"_id": 0, "channel_id": 1})
+            return {doc["channel_id"] async for doc in cursor}
+        except Exception as e:
+            LOGGER.error(f"Error getting sync outcomes for {job_id}: {e}")
+            return set()
+
+    # =================================================================
+    #  ADMIN SNAPSHOT METHODS
+    # =================================================================
+
+    @staticmethod
+    async def get_admin_snapshot(chat_id):
+        try:
+            return await Database.admin_snapshots.find_one({"channel_id": chat_id})
+        except Exception as e:
+            LOGGER.error(f"Error reading admin snapshot for {chat_id}: {e}")
+            return None
+
+    @staticmethod
+    async def save_admin_snapshot(chat_id, admins, participants_hash):
+        try:
+            await Database.admin_snapshots.update_one(
+                {"channel_id": chat_id},
+                {"$set": {
+                    "admins": admins,
+                    "hash": participants_hash,
+                    "verified_at": datetime.utcnow(),
+                }},
+                upsert=True
+            )
+        except Exception as e:
+            LOGGER.error(f"Error saving admin snapshot for {chat_id}: {e}")
+
+    @staticmethod
+    async def get_fresh_admin_snapshot_ids(since):
+        """Channels whose admin snapshot was verified at or after `since`"""
+        try:
+            cursor = Database.admin_snapshots.find({"verified_at": {"$gte": since}}, {"_id": 0, "channel_id": 1})
+            return {doc["channel_id"] async for doc in cursor}
+        except Exception as e:
+            LOGGER.error(f"Error reading fresh admin snapshots: {e}")
+            return set()
+
+    @staticmethod
+    async def touch_admin_snapshot(chat_id):
+        """Mark an unchanged snapshot as verified now"""
+        try:
+            await Database.admin_snapshots.update_one(
+                {"channel_id": chat_id}, {"$set": {"verified_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            LOGGER.error(f"Error touching admin snapshot for {chat_id}: {e}")
+
+    @staticmethod
+    async def delete_admin_snapshot(chat_id):
+        try:
+            await Database.admin_snapshots.delete_one({"channel_id": chat_id})
+        except Exception as e:
+            LOGGER.error(f"Error deleting admin snapshot for {chat_id}: {e}")
+
+    # =================================================================
+    #  INVITE LINK METHODS
+    # =================================================================
+
+    @staticmethod
+    async def get_invite_link(chat_id):
+        try:
+            doc = await Database.invite_links.find_one({"channel_id": chat_id})
+            return doc["link"] if doc else None
+        except Exception as e:
+            LOGGER.error(f"Error reading invite link for {chat_id}: {e}")
+            return None
+
+    @staticmethod
+    async def save_invite_link(chat_id, link):
+        try:
+            await Database.invite_links.update_one(
+                {"channel_id": chat_id},
+                {"$set": {"link": link, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            LOGGER.error(f"Error saving invite link for {chat_id}: {e}")
+
+    @staticmethod
+    async def get_invite_link_ids():
+        """Channels with a stored helper invite link"""
+        try:
+            cursor = Database.invite_links.find({}, {"_id": 0, "channel_id": 1})
+            return {doc["channel_id"] async for doc in cursor}
+        except Exception as e:
+            LOGGER.error(f"Error reading invite link ids: {e}")
+            return set()
+
+    @staticmethod
+    async def delete_invite_link(chat_id):
+        try:
+            await Database.invite_links.delete_one({"channel_id": chat_id})
+        except Exception as e:
+            LOGGER.error(f"Error deleting invite link for {chat_id}: {e}")
+
+    # =================================================================
+    #  OUTBOX METHODS
+    # =================================================================
+
+    @staticmethod
+    async def enqueue_outbox(chat_id, text):
+        try:
+            now = datetime.utcnow()
+            await Database.outbox.insert_one({
+                "chat_id": chat_id,
+                "text": text,
+                "attempts": 0,
+                "created_at": now,
+                "next_at": now,
+            })
+            return True
+        except Exception as e:
+            LOGGER.error(f"Error queueing notification for {chat_id}: {e}")
+            return False
+
+    @staticmethod
+    async def get_due_outbox(limit=500):
+        """Pending notifications whose retry time has come, oldest first"""
         try:
-            return await Database.archive_channels.find({}).to_list(length=None)
+            cursor = Database.outbox.find(
+                {"next_at": {"$lte": datetime.utcnow()}}
+            ).sort("created_at", 1).limit(limit)
+            return await cursor.to_list(length=limit)
         except Exception as e:
-            LOGGER.error(f"Error getting all archive channels: {e}")
+            LOGGER.error(f"Error reading outbox: {e}")
             return []
 
+    @staticmethod
+    async def delete_outbox(ids):
+        try:
+            await Database.outbox.delete_many({"_id": {"$in": ids}})
+        except Exception as e:
+            LOGGER.error(f"Error deleting outbox entries: {e}")
+
+    @staticmethod
+    async def defer_outbox(ids, until, failed=False):
+        """Retry later (`failed` also counts an attempt)"""
+        try:
+            update = {"$set": {"next_at": until}}
+            if failed:
+                update["$inc"] = {"attempts": 1}
+            await Database.outbox.update_many({"_id": {"$in": ids}}, update)
+        except Exception as e:
+            LOGGER.error(f"Error deferring outbox entries: {e}")
+
     # =================================================================
     #  SYSTEM STATE
     # =================================================================
     @staticmethod
-    async def update_queue_state(queue_data):
+    async def save_queue_job(job):
+        """Insert/replace the document of one queued task (keyed by chat_id)"""
         try:
-            await Database.db["system_state"].update_one(
-                {"_id": "queue_state"},
-                {"$set": {"users": queue_data, "updated_at": datetime.utcnow()}},
+            await Database.queue_jobs.replace_one({"_id": job["_id"]}, job, upsert=True)
+        except Exception as e:
+            LOGGER.error(f"Failed to save queue job {job.get('_id')}: {e}")
+
+    @staticmethod
+    async def mark_queue_job_active(chat_id):
+        try:
+            await Database.queue_jobs.update_one(
+                {"_id": chat_id},
+                {"$set": {"is_active": True, "started_at": datetime.utcnow()}}
+            )
+        except Exception as e:
+            LOGGER.error(f"Failed to mark queue job {chat_id} active: {e}")
+
+    @staticmethod
+    async def delete_queue_job(chat_id):
+        try:
+            await Database.queue_jobs.delete_one({"_id": chat_id})
+        except Exception as e:
+            LOGGER.error(f"Failed to delete queue job {chat_id}: {e}")
+
+    @staticmethod
+    async def get_queue_jobs():
+        """All saved tasks in one query: running ones first, then by enqueue time"""
+        try:
+            cursor = Database.queue_jobs.find({}).sort([("is_active", -1), ("enqueued_at", 1)])
+            return await cursor.to_list(length=None)
+        except Exception as e:
+            LOGGER.error(f"Failed to get queue jobs: {e}")
+            return []
+
+    @staticmethod
+    async def get_task_stats():
+        try:
+            return await Database.task_stats.find({}).to_list(length=None)
+        except Exception as e:
+            LOGGER.error(f"Failed to get task stats: {e}")
+            return []
+
+    @staticmethod
+    async def save_task_stat(key, entry):
+        try:
+            await Database.task_stats.update_one(
+                {"_id": key},
+                {"$set": {**entry, "updated_at": datetime.utcnow()}},
                 upsert=True
             )
         except Exception as e:
-            LOGGER.error(f"Failed to sync queue state: {e}")
+            LOGGER.error(f"Failed to save task stat {key}: {e}")
+
+    @staticmethod
+    async def insert_api_stats(docs):
+        try:
+            await Database.api_stats.insert_many(docs, ordered=False)
+        except Exception as e:
+            LOGGER.error(f"Failed to save API stats: {e}")
+
+    @staticmethod
+    async def aggregate_api_stats(since, sort_field, limit):
+        """Sum API stats per (client, method) since `since`, top `limit` by `sort_field`"""
+        try:
+            pipeline = [
+                {"$match": {"minute": {"$gte": since}}},
+                {"$group": {
+                    "_id": {"client": "$client", "method": "$method"},
+                    "count": {"$sum": "$count"},
+                    "errors": {"$sum": "$errors"},
+                    "total_time": {"$sum": "$total_time"},
+                    "flood_waits": {"$sum": "$flood_waits"},
+                    "flood_seconds": {"$sum": "$flood_seconds"},
+                    "callers": {"$addToSet": "$caller"},
+                }},
+                {"$match": {sort_field: {"$gt": 0}}},
+                {"$sort": {sort_field: -1}},
+                {"$limit": limit},
+            ]
+            return await Database.api_stats.aggregate(pipeline).to_list(length=limit)
+        except Exception as e:
+            LOGGER.error(f"Failed to aggregate API stats: {e}")
+            return []
 
     @staticmethod
     async def get_queue_state():
+        """Legacy full-snapshot queue state (read once for migration)"""
         try:
             doc = await Database.db["system_state"].find_one({"_id": "queue_state"})
             return doc.get("users", []) if doc else []
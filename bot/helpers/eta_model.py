@@ -0,0 +1,108 @@
+from config import Config
+from bot.helpers.database import Database
+from bot.utils.logger import LOGGER
+
+# EWMA smoothing factor (weight of the newest sample)
+EWMA_ALPHA = 0.2
+# Recent samples kept per key for percentiles
+MAX_SAMPLES = 50
+# Samples needed before a key's own stats are trusted
+MIN_SAMPLES = 3
+
+# Missing-bot buckets: (upper bound inclusive, label)
+WORKLOAD_BUCKETS = ((0, "0"), (2, "1-2"), (5, "3-5"), (10, "6-10"))
+
+def workload_bucket(missing_bots):
+    for upper, label in WORKLOAD_BUCKETS:
+        if missing_bots <= upper:
+            return label
+    return f"{WORKLOAD_BUCKETS[-1][0] + 1}+"
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+class EtaModel:
+    """
+    Learned task durations for queue ETAs.
+    - Keyed by handler (setup_logic / archive_logic) and missing-bot bucket.
+    - EWMA + recent samples per key, persisted in Mongo (task_stats).
+    """
+    def __init__(self):
+        self.stats = {}  # key -> {"handler", "bucket", "ewma", "count", "samples"}
+
+    @staticmethod
+    def _key(handler_name, missing_bots):
+        return f"{handler_name}:{workload_bucket(missing_bots)}"
+
+    async def load(self):
+        """Load persisted statistics (called once at startup)"""
+        for doc in await Database.get_task_stats():
+            self.stats[doc["_id"]] = {
+                "handler": doc.get("handler"),
+                "bucket": doc.get("bucket"),
+                "ewma": doc.get("ewma", 0),
+                "count": doc.get("count", 0),
+                "samples": doc.get("samples") or [],
+            }
+        LOGGER.info(f"✅ Loaded {len(self.stats)} task duration stats")
+
+    async def record(self, handler_name, missing_bots, duration):
+        """Add one finished task duration (seconds) and persist its key"""
+        if missing_bots is None:
+            missing_bots = len(Config.BOTS_TO_ADD)
+        key = self._key(handler_name, missing_bots)
+        entry = self.stats.setdefault(key, {
+            "handler": handler_name,
+            "bucket": workload_bucket(missing_bots),
+            "ewma": duration,
+            "count": 0,
+            "samples": [],
+        })
+        if entry["count"]:
+            entry["ewma"] = EWMA_ALPHA * duration + (1 - EWMA_ALPHA) * entry["ewma"]
+        entry["count"] += 1
+        entry["samples"] = (entry["samples"] + [round(duration, 1)])[-MAX_SAMPLES:]
+        await Database.save_task_stat(key, entry)
+
+    def _fallback(self, handler_name, missing_bots):
+        """Static guess until enough samples exist: 30s overhead + 3s per bot"""
+        # Prefer the average of this handler's other buckets, if any are trusted
+        known = [
+            entry["ewma"] for entry in self.stats.values()
+            if entry["handler"] == handler_name and entry["count"] >= MIN_SAMPLES
+        ]
+        if known:
+            return sum(known) / len(known)
+        return 30 + missing_bots * 3
+
+    def estimate(self, handler_name, missing_bots=None):
+        """Expected duration (seconds) of one task"""
+        if missing_bots is None:
+            missing_bots = len(Config.BOTS_TO_ADD)
+        entry = self.stats.get(self._key(handler_name, missing_bots))
+        if entry and entry["count"] >= MIN_SAMPLES:
+            return entry["ewma"]
+        return self._fallback(handler_name, missing_bots)
+
+    def summary(self):
+        """Rows for /stats: (handler, bucket, count, ewma, p50, p90); keys without samples are skipped"""
+        rows = []
+        for key in sorted(self.stats):
+            entry = self.stats[key]
+            if not entry["samples"]:
+                continue
+            rows.append((
+                entry["handler"],
+                entry["bucket"],
+                entry["count"],
+                entry["ewma"],
+                percentile(entry["samples"], 50),
+                percentile(entry["samples"], 90),
+            ))
+        return rows
+
+eta_model = EtaModel()
@@ -0,0 +1,133 @@
+import heapq
+import math
+from datetime import datetime
+
+# Half-life (seconds) of a unit of helper work in the cost-aware policy
+HEAT_HALF_LIFE = 7 * 24 * 3600
+# Fallback rejoin cost (invite export + join + settle), seconds
+DEFAULT_REJOIN_COST = 30
+EPOCH = datetime(2020, 1, 1)
+
+def _ts(moment):
+    """Seconds since EPOCH (datetime.min and None map to 0)"""
+    if not moment or moment <= EPOCH:
+        return 0.0
+    return (moment - EPOCH).total_seconds()
+
+def bump_heat(heat, moment):
+    """Add one unit of work at `moment` to a log-domain decayed counter"""
+    x = _ts(moment) * math.log(2) / HEAT_HALF_LIFE
+    if heat is None:
+        return x
+    high, low = max(heat, x), min(heat, x)
+    return high + math.log1p(math.exp(low - high))
+
+class MemberStats:
+    """What eviction policies know about one helper membership"""
+    __slots__ = ("joined_at", "last_used", "uses", "heat", "rejoin_cost")
+
+    def __init__(self, joined_at=None, last_used=None, uses=0, heat=None, rejoin_cost=None):
+        self.joined_at = joined_at or datetime.min
+        self.last_used = last_used or self.joined_at
+        self.uses = uses or 0
+        self.heat = heat
+        self.rejoin_cost = rejoin_cost or DEFAULT_REJOIN_COST
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(
+            doc.get("user_joined_at"), doc.get("last_helper_work"), doc.get("helper_work_count"),
+            doc.get("helper_heat"), doc.get("rejoin_cost"),
+        )
+
+    def used(self, moment):
+        self.last_used = moment
+        self.uses += 1
+        self.heat = bump_heat(self.heat, moment)
+
+# Each policy maps stats to a time-invariant sort key: the lowest key is
+# evicted first. Keys only change when the channel's stats change, so the
+# capacity manager can keep one lazy min-heap per policy.
+
+def oldest_key(stats):
+    """Oldest join first (previous behaviour)"""
+    return (stats.joined_at,)
+
+def lru_key(stats):
+    """Least recently used by helper work first"""
+    return (stats.last_used, stats.joined_at)
+
+def lfu_key(stats):
+    """Channels that needed the helper least often first (ties: LRU)"""
+    return (stats.uses, stats.last_used)
+
+def cost_key(stats):
+    """
+    Lowest expected rejoin cost first.
+    - heat: exponentially decayed work count (log domain), so
+      exp(heat - now / half-life) is the current demand for every channel.
+    - Adding log(rejoin_cost) ranks by demand x cost of rejoining.
+    """
+    heat = stats.heat if stats.heat is not None else bump_heat(None, stats.last_used)
+    return (heat + math.log(stats.rejoin_cost), stats.last_used)
+
+POLICIES = {
+    "oldest": oldest_key,
+    "lru": lru_key,
+    "lfu": lfu_key,
+    "cost": cost_key,
+}
+
+def get_policy(name):
+    return POLICIES.get(name, oldest_key)
+
+def simulate(events, capacity, policy):
+    """
+    Replay membership history against one policy.
+    - events: dicts with channel_id, event ("join" / "work" / "leave"),
+      reason, at and (joins) cost; oldest first.
+    - "work" is demand: the helper had to be in the channel. Voluntary
+      leaves (sync temp joins) are replayed; evictions are not, the
+      policy under test makes those. Joins only carry the rejoin cost.
+    Returns {"rejoins", "cold", "evictions", "hits"}.
+    """
+    key = get_policy(policy)
+    members = {}
+    heap = []
+    costs = {}
+    seen = set()
+    result = {"rejoins": 0, "cold": 0, "evictions": 0, "hits": 0}
+
+    for ev in events:
+        chat_id = ev["channel_id"]
+        if ev["event"] == "join":
+            if ev.get("cost"):
+                costs[chat_id] = ev["cost"]
+            continue
+        if ev["event"] == "leave":
+            if ev.get("reason") != "evict":
+                members.pop(chat_id, None)
+            continue
+
+        stats = members.get(chat_id)
+        if stats is None:
+            if chat_id in seen:
+                result["rejoins"] += 1
+            else:
+                result["cold"] += 1
+            seen.add(chat_id)
+            while len(members) >= capacity and heap:
+                entry_key, victim = heapq.heappop(heap)
+                victim_stats = members.get(victim)
+                if victim_stats is None or key(victim_stats) != entry_key:
+                    continue
+                del members[victim]
+                result["evictions"] += 1
+            stats = MemberStats(joined_at=ev["at"], rejoin_cost=costs.get(chat_id))
+            members[chat_id] = stats
+        else:
+            result["hits"] += 1
+        stats.used(ev["at"])
+        heapq.heappush(heap, (key(stats), chat_id))
+
+    return result
@@ -0,0 +1,38 @@
+from bot.client import Clients
+from bot.helpers.database import Database
+from bot.utils.logger import LOGGER
+
+# Name of the bot-created link the helper joins through
+INVITE_LINK_NAME = "LinkerX helper"
+
+class InviteCache:
+    """
+    Per-channel helper invite links (Bot creates, stored in `invite_links`).
+    - One dedicated, non-expiring link per channel, reused for every
+      join and eviction report.
+    - Validated lazily: only a join failing with an expired/invalid hash
+      replaces it.
+    - Created with create_chat_invite_link, so the owner's primary link
+      is never revoked.
+    """
+    @staticmethod
+    async def get(chat_id):
+        """Cached link, created on first use"""
+        link = await Database.get_invite_link(chat_id)
+        if link:
+            return link
+        return await InviteCache.refresh(chat_id)
+
+    @staticmethod
+    async def refresh(chat_id):
+        """Create a new link and store it (raises if the bot cannot)"""
+        invite = await Clients.bot.create_chat_invite_link(chat_id, name=INVITE_LINK_NAME)
+        await Database.save_invite_link(chat_id, invite.invite_link)
+        LOGGER.info(f"🔗 New helper invite link for {chat_id}")
+        return invite.invite_link
+
+    @staticmethod
+    async def invalidate(chat_id):
+        await Database.delete_invite_link(chat_id)
+
+invite_cache = InviteCache()
@@ -0,0 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
+from bot.utils.logger import LOGGER
+
+class ChannelLocks:
+    """
+    Per-channel async locks shared by setups, queue tasks and sync.
+    - Work on different channels never waits on each other.
+    - Waiters are woken by the lock itself (no polling).
+    - Locked channels are protected from auto-cleanup.
+    """
+    def __init__(self):
+        self._locks = {}    # chat_id -> asyncio.Lock
+        self._waiters = {}  # chat_id -> tasks holding or waiting for the lock
+        self.holders = {}   # chat_id -> label of the current holder
+
+    def is_locked(self, chat_id):
+        lock = self._locks.get(chat_id)
+        return lock is not None and lock.locked()
+
+    def locked_ids(self):
+        """Channels currently held (setup, queue task or sync step)"""
+        return set(self.holders)
+
+    @asynccontextmanager
+    async def lock(self, chat_id, holder="task"):
+        """Hold `chat_id` exclusively for the duration of the block"""
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        self._waiters[chat_id] = self._waiters.get(chat_id, 0) + 1
+        try:
+            if lock.locked():
+                LOGGER.info(f"🔒 {holder} waiting for {chat_id} (held by {self.holders.get(chat_id)})")
+            async with lock:
+                self.holders[chat_id] = holder
+                try:
+                    yield
+                finally:
+                    self.holders.pop(chat_id, None)
+        finally:
+            # Drop idle locks so the table only holds channels in use
+            self._waiters[chat_id] -= 1
+            if not self._waiters[chat_id]:
+                del self._waiters[chat_id]
+                del self._locks[chat_id]
+
+channel_locks = ChannelLocks()
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from pyrogram import enums
+from pyrogram.handlers import ChatMemberUpdatedHandler
+from bot.client import Clients
+from bot.helpers.database import Database
+from bot.helpers.capacity import capacity
+from config import Config
+from bot.utils.logger import LOGGER
+
+CHANNEL_TYPES = (enums.ChatType.CHANNEL, enums.ChatType.SUPERGROUP)
+NOT_MEMBER = (enums.ChatMemberStatus.LEFT, enums.ChatMemberStatus.BANNED)
+
+class MembershipIndex:
+    """
+    Channels the helper account is in, kept in memory.
+    - Rebuilt from one paginated sweep of the helper's dialogs, which also
+      corrects user_is_member drift in `channels` with one bulk write.
+    - Kept current by our own joins/leaves and by chat-member updates
+      the helper receives.
+    - is_member() answers without a Telegram call (None before the first sweep).
+    """
+    def __init__(self):
+        self.chat_ids = set()
+        self.ready = False
+        self._sweeping = None  # chat_id -> bool changes seen while a sweep runs
+
+    def is_member(self, chat_id):
+        if not self.ready:
+            return None
+        return chat_id in self.chat_ids
+
+    def _set(self, chat_id, is_member):
+        if is_member:
+            self.chat_ids.add(chat_id)
+        else:
+            self.chat_ids.discard(chat_id)
+        if self._sweeping is not None:
+            self._sweeping[chat_id] = is_member
+
+    def joined(self, chat_id):
+        self._set(chat_id, True)
+
+    def left(self, chat_id):
+        self._set(chat_id, False)
+
+    async def sweep(self):
+        """Rebuild from the helper's dialogs and fix drift in Mongo"""
+        started = time.monotonic()
+        self._sweeping = {}
+        try:
+            chat_ids = set()
+            async for dialog in Clients.user_app.get_dialogs():
+                if dialog.chat.type in CHANNEL_TYPES:
+                    chat_ids.add(dialog.chat.id)
+            # Joins/leaves made while the sweep paged through are newer
+            for chat_id, is_member in self._sweeping.items():
+                if is_member:
+                    chat_ids.add(chat_id)
+                else:
+                    chat_ids.discard(chat_id)
+        finally:
+            self._sweeping = None
+
+        self.chat_ids = chat_ids
+        self.ready = True
+
+        corrected = await Database.correct_membership(chat_ids)
+        if corrected:
+            LOGGER.warning(f"👥 Membership drift: corrected {corrected} channel(s) in DB")
+            await capacity.reconcile()
+        LOGGER.info(
+            f"👥 Membership index: helper is in {len(chat_ids)} channels "
+            f"(sweep took {time.monotonic() - started:.1f}s)"
+        )
+
+    async def on_member_updated(self, client, update):
+        """Chat-member update on the helper account: track its own status"""
+        member = update.new_chat_member or update.old_chat_member
+        if not member or not member.user or not client.me or member.user.id != client.me.id:
+            return
+        new = update.new_chat_member
+        is_member = bool(new) and new.status not in NOT_MEMBER and (
+            new.status != enums.ChatMemberStatus.RESTRICTED or new.is_member
+        )
+        self._set(update.chat.id, is_member)
+
+    def register(self):
+        Clients.user_app.add_handler(ChatMemberUpdatedHandler(self.on_member_updated))
+
+    async def sweeper(self):
+        """Background task: sweep at startup, then every MEMBERSHIP_SWEEP_INTERVAL"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                LOGGER.error(f"Membership sweep error: {e}")
+            await asyncio.sleep(Config.MEMBERSHIP_SWEEP_INTERVAL)
+
+membership = MembershipIndex()
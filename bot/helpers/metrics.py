@@ -0,0 +1,157 @@
+import time
+from contextlib import contextmanager
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Base for in-memory metrics rendered in Prometheus text format"""
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, _format_labels(self.label_names, key), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Gauge set directly, or computed at scrape time by `callback` ({label tuple: value})"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labels=(), callback=None):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback:
+            try:
+                self.values = dict(self.callback())
+            except Exception:
+                pass
+        yield from super().samples()
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labels=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["counts"][index] += 1
+                break
+        state["sum"] += value
+        state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the `with` block"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def samples(self):
+        for key, state in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, ("le", _format_value(bound)))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.label_names, key)
+            yield f"{self.name}_sum", labels, state["sum"]
+            yield f"{self.name}_count", labels, state["count"]
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+registry = Registry()
+
+# =================================================================
+#  METRICS
+# =================================================================
+
+QUEUE_DEPTH = registry.register(Gauge(
+    "linkerx_queue_depth", "Waiting queue tasks per priority lane", labels=("priority",)
+))
+QUEUE_ACTIVE = registry.register(Gauge(
+    "linkerx_queue_active_tasks", "Queue tasks currently running"
+))
+QUEUE_WAIT = registry.register(Histogram(
+    "linkerx_queue_wait_seconds", "Time from enqueue to start of a queue task",
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200), labels=("priority",)
+))
+HELPER_MEMBERSHIPS = registry.register(Gauge(
+    "linkerx_helper_memberships", "Channels the helper account is a member of (last known)"
+))
+HELPER_MEMBERSHIP_LIMIT = registry.register(Gauge(
+    "linkerx_helper_membership_limit", "MAX_USER_CHANNELS"
+))
+SETUP_STEP = registry.register(Histogram(
+    "linkerx_setup_step_seconds", "Duration of each setup/archive step",
+    buckets=(0.5, 1, 2.5, 5, 10, 15, 30, 60, 120, 300, 600), labels=("handler", "step")
+))
+SYNC_PROGRESS = registry.register(Gauge(
+    "linkerx_sync_channels", "Progress of the current/last sync run", labels=("kind", "state")
+))
+MONGO_LATENCY = registry.register(Histogram(
+    "linkerx_mongo_op_seconds", "MongoDB command latency",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5), labels=("command", "outcome")
+))
+FLOOD_WAIT_SECONDS = registry.register(Counter(
+    "linkerx_floodwait_seconds_total", "FloodWait seconds received from Telegram", labels=("client",)
+))
+
+def set_sync_progress(kind, **counts):
+    """Publish sync counters, e.g. set_sync_progress("main", total=10, processed=3)"""
+    for state, value in counts.items():
+        SYNC_PROGRESS.set(value, kind=kind, state=state)
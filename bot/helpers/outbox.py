@@ -0,0 +1,121 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from pyrogram.errors import FloodWait, UserIsBlocked, PeerIdInvalid, InputUserDeactivated
+from bot.client import Clients
+from bot.helpers.database import Database
+from bot.helpers.rate_limiter import TokenBucket
+from bot.utils.logger import LOGGER
+
+# Global send budget for outbox messages (messages per second, burst)
+OUTBOX_RATE = 1
+OUTBOX_BURST = 5
+# Minimum seconds between two digests to the same chat
+OUTBOX_CHAT_INTERVAL = 10
+# Wait after a wake-up so bursts of notices land in one digest
+OUTBOX_COALESCE = 3
+# Fallback poll for deferred entries (FloodWait / retry backoff)
+OUTBOX_POLL = 30
+OUTBOX_MAX_ATTEMPTS = 5
+# Telegram message length limit
+MAX_MESSAGE_LENGTH = 4096
+DIGEST_SEPARATOR = "\n\n━━━━━━━━━━\n\n"
+
+class Outbox:
+    """
+    Mongo-backed notification outbox.
+    - send() only stores the message; callers never wait on Telegram.
+    - A background sender merges pending messages per recipient into one
+      digest, paced by a global bucket and a per-chat interval.
+    - FloodWait defers the recipient's entries; other errors retry with
+      backoff, unreachable users are dropped.
+    """
+    def __init__(self):
+        self.bucket = TokenBucket(OUTBOX_RATE, OUTBOX_BURST)
+        self.next_send = {}  # chat_id -> monotonic time the chat may receive again
+        self._wake = asyncio.Event()
+
+    async def send(self, chat_id, text):
+        """Queue `text` for `chat_id` (persisted, survives restarts)"""
+        if not chat_id:
+            return
+        if await Database.enqueue_outbox(chat_id, text):
+            self._wake.set()
+
+    @staticmethod
+    def build_digest(entries):
+        """Merge entries into one message; returns (text, entries included)"""
+        if len(entries) == 1:
+            return entries[0]["text"][:MAX_MESSAGE_LENGTH], entries
+
+        header = f"📬 **{len(entries)} notifications**\n\n"
+        parts, included = [], []
+        length = len(header)
+        for entry in entries:
+            extra = len(entry["text"]) + (len(DIGEST_SEPARATOR) if parts else 0)
+            if parts and length + extra > MAX_MESSAGE_LENGTH:
+                break
+            parts.append(entry["text"])
+            included.append(entry)
+            length += extra
+        if len(included) == 1:
+            return included[0]["text"][:MAX_MESSAGE_LENGTH], included
+        header = f"📬 **{len(included)} notifications**\n\n"
+        return (header + DIGEST_SEPARATOR.join(parts))[:MAX_MESSAGE_LENGTH], included
+
+    async def sender(self):
+        """Background task: deliver pending notifications"""
+        LOGGER.info("📬 Outbox sender started")
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=OUTBOX_POLL)
+                await asyncio.sleep(OUTBOX_COALESCE)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                LOGGER.error(f"Outbox sender error: {e}")
+
+    async def flush(self):
+        entries = await Database.get_due_outbox()
+        by_chat = {}
+        for entry in entries:
+            by_chat.setdefault(entry["chat_id"], []).append(entry)
+
+        for chat_id, pending in by_chat.items():
+            if self.next_send.get(chat_id, 0) > time.monotonic():
+                continue
+            await self.deliver(chat_id, pending)
+
+    async def deliver(self, chat_id, pending):
+        text, included = self.build_digest(pending)
+        ids = [entry["_id"] for entry in included]
+
+        await self.bucket.acquire()
+        try:
+            await Clients.bot.send_message(chat_id, text)
+            await Database.delete_outbox(ids)
+            self.next_send[chat_id] = time.monotonic() + OUTBOX_CHAT_INTERVAL
+            if len(included) < len(pending):
+                # Leftovers go out in the next digest
+                self._wake.set()
+        except FloodWait as e:
+            LOGGER.warning(f"📬 FloodWait {e.value}s sending to {chat_id}, deferring")
+            self.next_send[chat_id] = time.monotonic() + e.value
+            await Database.defer_outbox(ids, datetime.utcnow() + timedelta(seconds=e.value))
+        except (UserIsBlocked, PeerIdInvalid, InputUserDeactivated) as e:
+            LOGGER.warning(f"📬 Dropping {len(ids)} notification(s) for unreachable {chat_id}: {e}")
+            await Database.delete_outbox(ids)
+        except Exception as e:
+            attempts = max(entry.get("attempts", 0) for entry in included) + 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                LOGGER.error(f"📬 Giving up on {len(ids)} notification(s) for {chat_id}: {e}")
+                await Database.delete_outbox(ids)
+            else:
+                LOGGER.warning(f"📬 Send to {chat_id} failed ({attempts}/{OUTBOX_MAX_ATTEMPTS}): {e}")
+                backoff = timedelta(seconds=60 * attempts)
+                await Database.defer_outbox(ids, datetime.utcnow() + backoff, failed=True)
+
+outbox = Outbox()
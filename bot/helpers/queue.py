@@ -1,7 +1,16 @@
 import asyncio
+import heapq
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
 from pyrogram.errors import FloodWait
 from bot.utils.logger import LOGGER
 from bot.helpers.database import Database
+from bot.helpers.locks import channel_locks
+from bot.helpers.rate_limiter import TokenBucket
+from bot.helpers.eta_model import eta_model
+from bot.helpers.admin_cache import AdminSnapshot
+from bot.helpers.metrics import QUEUE_DEPTH, QUEUE_ACTIVE, QUEUE_WAIT
 from bot.client import Clients
 from config import Config
 
@@ -22,17 +31,180 @@ class VirtualMessage:
         except Exception as e:
             LOGGER.debug(f"VirtualMessage edit failed: {e}")
 
+class MessageGroup:
+    """
+    Status message of one task, fanned out to every request merged into it.
+    - Behaves like the primary message (id/chat/edit).
+    - Extra messages are edited best-effort.
+    """
+    def __init__(self, primary):
+        self.messages = [primary]
+
+    @property
+    def id(self):
+        return self.messages[0].id
+
+    @property
+    def chat(self):
+        return self.messages[0].chat
+
+    def add(self, message):
+        self.messages.append(message)
+
+    async def edit(self, text):
+        primary, *others = self.messages
+        for message in others:
+            try:
+                await message.edit(text)
+            except Exception as e:
+                LOGGER.debug(f"Merged message edit failed: {e}")
+        await primary.edit(text)
+
+# Priority classes, highest first
+PRIORITY_SETUP = "setup"
+PRIORITY_ARCHIVE = "archive"
+PRIORITY_MAINTENANCE = "maintenance"
+PRIORITIES = (PRIORITY_SETUP, PRIORITY_ARCHIVE, PRIORITY_MAINTENANCE)
+
+# "Bot Restarted" notices: edits per second + parallel requests
+RESTORE_NOTICE_RATE = 20
+RESTORE_NOTICE_CONCURRENCY = 5
+
+# Position notifier: debounce window, global edits per second, min gap per chat
+POSITION_DEBOUNCE = 3
+POSITION_EDIT_RATE = 5
+POSITION_CHAT_INTERVAL = 10
+
+def get_task_handlers():
+    """Handler name -> function, used to resume saved tasks"""
+    # Imported here to avoid circular imports
+    from bot.modules.setup import setup_logic
+    from bot.modules.archive import archive_logic
+    return {
+        "setup_logic": setup_logic,
+        "archive_logic": archive_logic,
+    }
+
 class QueueManager:
+    """
+    Scheduler for setup/archive tasks.
+    - One lane per priority class; higher lanes always go first.
+    - Inside a lane, owners are served round-robin (one task per owner per turn).
+    """
     def __init__(self):
-        self.queue = asyncio.Queue()
-        self.waiting_users = []
-        self.current_task = None  # Track what is currently running
+        # priority -> OrderedDict(owner_id -> deque of tasks); dict order = turn order
+        self.lanes = {priority: OrderedDict() for priority in PRIORITIES}
+        self.tasks = {}  # chat_id -> waiting task data (O(1) membership)
+        self._order = None  # cached scheduled order (deque), None = rebuild on next read
+        self._positions = {}  # chat_id -> sequence number in the cached order
+        self._head = 0  # sequence number of the cached order's first task
+        self._available = asyncio.Condition()
+        self.active_tasks = {}  # chat_id -> task data, for every running worker
+        self.workers = []
+        self._positions_dirty = asyncio.Event()
+        self._position_budget = TokenBucket(POSITION_EDIT_RATE, POSITION_EDIT_RATE)
+        self._last_position_edit = {}  # chat_id -> monotonic time of last edit
+    
+    @property
+    def waiting_users(self):
+        """
+        Waiting tasks in the exact order workers will pick them up.
+        - Cached: rebuilt (O(n)) only on the first read after an enqueue.
+        - Dequeues just drop the head, so positions stay valid in O(1).
+        """
+        if self._order is None:
+            order = deque()
+            for lane in self.lanes.values():
+                turns = [list(tasks) for tasks in lane.values()]
+                depth = max((len(tasks) for tasks in turns), default=0)
+                for round_idx in range(depth):
+                    for tasks in turns:
+                        if round_idx < len(tasks):
+                            order.append(tasks[round_idx])
+            self._order = order
+            self._positions = {data["chat_id"]: index for index, data in enumerate(order)}
+            self._head = 0
+        return self._order
+    
+    def lane_sizes(self):
+        """Number of waiting tasks per priority class"""
+        return {
+            priority: sum(len(tasks) for tasks in lane.values())
+            for priority, lane in self.lanes.items()
+        }
+    
+    def _push(self, data):
+        lane = self.lanes[data["priority"]]
+        lane.setdefault(data["owner_id"], deque()).append(data)
+        self.tasks[data["chat_id"]] = data
+        self._order = None
+    
+    def _pop_next(self):
+        """Take the next task: highest lane, owner whose turn it is"""
+        for lane in self.lanes.values():
+            if not lane:
+                continue
+            owner_id, tasks = next(iter(lane.items()))
+            data = tasks.popleft()
+            # Owner goes to the back of the line (or leaves it when empty)
+            del lane[owner_id]
+            if tasks:
+                lane[owner_id] = tasks
+            del self.tasks[data["chat_id"]]
+            # The picked task is always the head of the scheduled order, and
+            # moving its owner to the back keeps the rest of the order intact
+            if self._order and self._order[0] is data:
+                self._order.popleft()
+                self._positions.pop(data["chat_id"], None)
+                self._head += 1
+            else:
+                self._order = None
+            return data
+        return None
+    
+    def _has_waiting(self):
+        return bool(self.tasks)
+    
+    def find(self, chat_id):
+        """Task for this channel, waiting or running (None if absent)"""
+        return self.tasks.get(chat_id) or self.active_tasks.get(chat_id)
     
-    def calculate_wait(self, position):
-        """Calculate wait: 30s overhead + 3s per bot"""
-        bots_count = len(Config.BOTS_TO_ADD)
-        time_per_user = 30 + (bots_count * 3)
-        total_seconds = position * time_per_user
+    @property
+    def worker_count(self):
+        return max(1, Config.QUEUE_WORKERS)
+    
+    @staticmethod
+    def _task_estimate(data):
+        return eta_model.estimate(data["handler"].__name__, data.get("workload"))
+    
+    def estimate_waits(self):
+        """
+        Seconds until each waiting task starts, in scheduled order.
+        - Active tasks free their worker after their learned duration.
+        - Waiting tasks are assigned to the earliest free worker in turn.
+        """
+        now = time.monotonic()
+        free_at = [
+            max(0, self._task_estimate(task) - (now - task["started"]))
+            for task in self.active_tasks.values()
+        ]
+        free_at += [0] * max(0, self.worker_count - len(free_at))
+        heapq.heapify(free_at)
+        
+        waits = []
+        for task in self.waiting_users:
+            start = heapq.heappop(free_at)
+            waits.append(start)
+            heapq.heappush(free_at, start + self._task_estimate(task))
+        return waits
+    
+    def calculate_wait(self, position, waits=None):
+        """Formatted wait for the waiting task at index `position` (0-based)"""
+        if waits is None:
+            waits = self.estimate_waits()
+        seconds = waits[position] if position < len(waits) else 0
+        # Round up to 15s steps so small drifts don't change the display
+        total_seconds = int(-(-seconds // 15) * 15)
         
         if total_seconds < 60:
             return f"{total_seconds}s"
@@ -41,169 +213,326 @@ class QueueManager:
 
     def get_position(self, chat_id):
         """Check if a chat is already in the queue and return its position (1-based)"""
-        for index, user in enumerate(self.waiting_users):
-            if user["chat_id"] == chat_id:
-                return index + 1
-        return None
+        if chat_id not in self.tasks:
+            return None
+        self.waiting_users  # rebuild the index if the queue changed
+        seq = self._positions.get(chat_id)
+        return None if seq is None else seq - self._head + 1
 
-    async def sync_db(self):
-        """Sync ACTIVE task + WAITING list to DB for crash recovery"""
-        snapshot = []
-        
-        # 1. Add current task (if any) to front of list
-        if self.current_task:
-            snapshot.append({
-                "chat_id": self.current_task["chat_id"],
-                "owner_id": self.current_task["owner_id"],
-                "message_id": self.current_task["msg"].id,
-                "is_active": True
-            })
-            
-        # 2. Add waiting users
-        for user in self.waiting_users:
-            snapshot.append({
-                "chat_id": user["chat_id"],
-                "owner_id": user["owner_id"],
-                "message_id": user["msg"].id,
-                "is_active": False
-            })
-            
-        await Database.update_queue_state(snapshot)
+    async def merge_request(self, chat_id, message):
+        """
+        Attach a repeated request to the existing task for this channel.
+        - The new message receives the same progress/result updates.
+        - Returns False if the channel has no queued or running task.
+        """
+        data = self.find(chat_id)
+        if not data:
+            return False
+        
+        data["msg"].add(message)
+        
+        if chat_id in self.active_tasks:
+            text = "⚙️ **Already Processing**\nThis channel is being set up right now. Updates will appear here."
+        else:
+            position = self.get_position(chat_id)
+            text = (
+                f"⚠️ **Request Already Queued**\n"
+                f"📍 Position: #{position}\n"
+                f"⏱️ Est. Wait: ~{self.calculate_wait(position - 1)}\n"
+                f"Your request was merged with the existing one."
+            )
+        try:
+            await message.edit(text)
+        except Exception as e:
+            LOGGER.debug(f"Merge notice failed: {e}")
+        return True
+
+    async def persist_task(self, data):
+        """Save one task document (O(1) write per enqueue)"""
+        await Database.save_queue_job({
+            "_id": data["chat_id"],
+            "owner_id": data["owner_id"],
+            "message_id": data["msg"].id,
+            "handler": data["handler"].__name__,
+            "priority": data["priority"],
+            "workload": data.get("workload"),
+            "admins": data["admins"].to_doc() if data.get("admins") else None,
+            "enqueued_at": data["enqueued_at"],
+            "is_active": False
+        })
 
     async def restore_queue(self):
-        """Restore queue from database after restart"""
-        saved_queue = await Database.get_queue_state()
+        """Restore queue from database after restart (single bulk read)"""
+        saved_queue = await Database.get_queue_jobs()
+        
+        # One-time migration from the old full-snapshot document
+        legacy_queue = await Database.get_queue_state()
+        if legacy_queue:
+            await Database.clear_queue_state()
+            saved_queue += [
+                {**item, "_id": item.get("chat_id"), "handler": "setup_logic"}
+                for item in legacy_queue
+            ]
+        
         if not saved_queue:
             return
 
         LOGGER.info(f"♻️ Restoring {len(saved_queue)} tasks from previous session...")
         
-        # Import setup_logic here to avoid circular imports
-        from bot.modules.setup import setup_logic
+        handlers = get_task_handlers()
+        restored = []
+        restored_ids = set()
         
         for item in saved_queue:
             # Use .get() to safely handle old data that might lack keys
-            chat_id = item.get("chat_id")
+            chat_id = item.get("_id")
             message_id = item.get("message_id")
             owner_id = item.get("owner_id")
+            handler = handlers.get(item.get("handler"), handlers["setup_logic"])
+            priority = item.get("priority", PRIORITY_SETUP)
+            if priority not in PRIORITIES:
+                priority = PRIORITY_SETUP
             
             # Skip corrupted/old entries
             if not chat_id or not message_id:
                 LOGGER.warning(f"Skipping invalid queue entry: {item}")
                 continue
 
-            # Create a VirtualMessage so setup_logic can call .edit()
+            # Create a VirtualMessage so the handler can call .edit()
             v_msg = VirtualMessage(chat_id, message_id)
             
+            # Skip duplicates (e.g. same channel in legacy snapshot and queue_jobs)
+            if self.find(chat_id) or chat_id in restored_ids:
+                continue
+            
             data = {
-                "msg": v_msg,
+                "msg": MessageGroup(v_msg),
                 "chat_id": chat_id,
                 "owner_id": owner_id,
-                "handler": setup_logic
+                "handler": handler,
+                "priority": priority,
+                "workload": item.get("workload"),
+                "admins": AdminSnapshot.from_doc(item.get("admins")),
+                "enqueued_at": item.get("enqueued_at") or datetime.utcnow()
             }
+            restored.append(data)
+            restored_ids.add(chat_id)
             
-            self.waiting_users.append(data)
-            await self.queue.put(data)
-            
-            # Notify user
-            try:
-                await v_msg.edit("🔄 **Bot Restarted!**\nResuming your task automatically...")
-            except:
-                pass
+            # Re-save legacy entries (and reset tasks that were running)
+            if legacy_queue or item.get("is_active"):
+                await self.persist_task(data)
+        
+        # Notify users first: tasks only reach the lanes afterwards, so a
+        # worker's "Processing..." edit can never be overwritten by a notice
+        await self._send_restart_notices(restored)
+        
+        async with self._available:
+            for data in restored:
+                # A fresh request for the channel may have arrived meanwhile
+                if not self.find(data["chat_id"]):
+                    self._push(data)
+            self._available.notify(len(restored))
+        self.update_positions()
 
-    async def add_to_queue(self, message, target_chat, owner_id, handler):
-        """Add to queue with immediate DB sync"""
+    async def _send_restart_notices(self, tasks):
+        """Edit restored task messages concurrently, within an edit budget"""
+        budget = TokenBucket(RESTORE_NOTICE_RATE, RESTORE_NOTICE_RATE)
+        semaphore = asyncio.Semaphore(RESTORE_NOTICE_CONCURRENCY)
+        
+        async def notify(data):
+            async with semaphore:
+                await budget.acquire()
+                try:
+                    await data["msg"].edit("🔄 **Bot Restarted!**\nResuming your task automatically...")
+                except Exception:
+                    pass
+        
+        await asyncio.gather(*(notify(data) for data in tasks))
+
+    async def add_to_queue(self, message, target_chat, owner_id, handler, priority=PRIORITY_SETUP, workload=None, admins=None):
+        """
+        Add to queue (in the lane for `priority`) with immediate DB sync.
+        `workload` is the number of missing bots, used for ETAs (None = all bots).
+        `admins` is the AdminSnapshot taken by the command, handed to the handler.
+        """
+        # Coalesce with a task already queued/running for this channel
+        if await self.merge_request(target_chat, message):
+            LOGGER.info(f"[QUEUE] Merged repeated request for {target_chat}")
+            return
+        
         data = {
-            "msg": message,
+            "msg": MessageGroup(message),
             "chat_id": target_chat,
             "owner_id": owner_id,
-            "handler": handler
+            "handler": handler,
+            "priority": priority,
+            "workload": workload,
+            "admins": admins,
+            "enqueued_at": datetime.utcnow()
         }
-        self.waiting_users.append(data)
-        
-        # Save state immediately
-        await self.sync_db()
-        
-        queue_len = len(self.waiting_users)
-        # Check if worker is idle (queue empty but no current task) or busy
-        wait_pos = queue_len 
-        if self.current_task:
-             wait_pos += 1
-             
-        est_wait = self.calculate_wait(wait_pos - 1)
-        
-        await message.edit(
-            f"⏳ **Added to Queue**\n"
-            f"📍 Position: #{queue_len}\n"
-            f"⏱️ Est. Wait: ~{est_wait}\n"
-            f"Please wait..."
+        self._push(data)
+        
+        try:
+            # Save state immediately
+            await self.persist_task(data)
+            
+            position = self.get_position(target_chat) or 1
+            est_wait = self.calculate_wait(position - 1)
+            
+            await message.edit(
+                f"⏳ **Added to Queue**\n"
+                f"📍 Position: #{position}\n"
+                f"⏱️ Est. Wait: ~{est_wait}\n"
+                f"Please wait..."
+            )
+            data["shown"] = (position, est_wait)
+        finally:
+            # Wake a worker only after the queue message is shown
+            async with self._available:
+                self._available.notify()
+            # A new owner's turn can move other users' positions
+            self.update_positions()
+    
+    def update_positions(self):
+        """Flag that queue positions changed; the notifier coalesces bursts"""
+        self._positions_dirty.set()
+    
+    def _position_text(self, index, waits):
+        """Message text for the waiting task at `index`, plus the (position, ETA) shown"""
+        if index < max(1, self.worker_count - len(self.active_tasks)):
+            return ("next", None), "🔄 **You're Next!**\n⚙️ Starting setup now..."
+        est_wait = self.calculate_wait(index, waits)
+        return (index + 1, est_wait), (
+            f"⏳ **Queue Position: #{index+1}**\n"
+            f"📊 {index} user(s) ahead of you\n"
+            f"⏱️ Est. Wait: ~{est_wait}"
         )
-        await self.queue.put(data)
     
-    async def update_positions(self):
-        """Update messages for waiting users"""
-        if not self.waiting_users:
-            return
+    async def position_notifier(self):
+        """
+        Long-lived task that keeps waiting users' messages current.
+        - Debounces bursts of queue changes into one pass.
+        - Edits only messages whose displayed position/ETA changed.
+        - Respects a global edit rate and a minimum gap per chat.
+        """
+        LOGGER.info("✅ Queue position notifier started")
+        while True:
+            await self._positions_dirty.wait()
+            await asyncio.sleep(POSITION_DEBOUNCE)
+            self._positions_dirty.clear()
             
-        current_users = list(self.waiting_users)
+            try:
+                await self._publish_positions()
+            except Exception as e:
+                LOGGER.error(f"Position notifier error: {e}")
+    
+    async def _publish_positions(self):
+        loop = asyncio.get_running_loop()
+        deferred = False
+        waits = self.estimate_waits()
         
-        for i, req in enumerate(current_users):
+        # Snapshot: workers may dequeue while this pass awaits edits
+        for i, data in enumerate(list(self.waiting_users)):
+            # Newer changes arrived: restart with the fresh order
+            if self._positions_dirty.is_set():
+                return
+            
+            shown, text = self._position_text(i, waits)
+            if data.get("shown") == shown:
+                continue
+            
+            chat_id = data["chat_id"]
+            last_edit = self._last_position_edit.get(chat_id, 0)
+            if loop.time() - last_edit < POSITION_CHAT_INTERVAL:
+                deferred = True
+                continue
+            
+            await self._position_budget.acquire()
+            # Task may have been picked up while we waited for budget
+            if chat_id in self.active_tasks:
+                continue
+            
             try:
-                # Use getattr to safely handle VirtualMessage vs Pyrogram Message
-                # msg_id = getattr(req["msg"], "id", None)
-                
-                if i == 0:
-                    await req["msg"].edit("🔄 **You're Next!**\n⚙️ Starting setup now...")
-                else:
-                    est_wait = self.calculate_wait(i)
-                    await req["msg"].edit(
-                        f"⏳ **Queue Position: #{i+1}**\n"
-                        f"📊 {i} user(s) ahead of you\n"
-                        f"⏱️ Est. Wait: ~{est_wait}"
-                    )
-                await asyncio.sleep(1.5)
+                await data["msg"].edit(text)
+                data["shown"] = shown
+                self._last_position_edit[chat_id] = loop.time()
             except FloodWait as e:
-                await asyncio.sleep(e.value + 1)
+                # Bot edits are paused by the rate limiter; retry on a later pass
+                LOGGER.warning(f"⏳ FloodWait in position notifier: {e.value}s")
+                deferred = True
             except Exception:
                 pass
+        
+        # Drop bookkeeping for chats no longer waiting
+        waiting_ids = {data["chat_id"] for data in self.waiting_users}
+        for chat_id in list(self._last_position_edit):
+            if chat_id not in waiting_ids:
+                del self._last_position_edit[chat_id]
+        
+        if deferred:
+            # Some chats were rate-limited; retry them on a later pass
+            await asyncio.sleep(POSITION_CHAT_INTERVAL)
+            self._positions_dirty.set()
     
-    async def worker(self):
-        """Process queue requests one by one"""
-        LOGGER.info("✅ Queue worker started")
+    def start_workers(self):
+        """Spawn the configured number of queue workers"""
+        for worker_id in range(1, self.worker_count + 1):
+            self.workers.append(asyncio.create_task(self.worker(worker_id)))
+        self.workers.append(asyncio.create_task(self.position_notifier()))
+        LOGGER.info(f"✅ Started {self.worker_count} queue worker(s)")
+    
+    async def worker(self, worker_id=1):
+        """
+        Process queue requests.
+        - Several workers run side by side, each on a different channel.
+        - Pacing comes from the shared helper write budget, not a fixed cooldown.
+        """
+        LOGGER.info(f"✅ Queue worker #{worker_id} started")
         while True:
-            # 1. Get next task
-            data = await self.queue.get()
-            
-            # 2. Mark as Active & Sync DB
-            self.current_task = data
-            if data in self.waiting_users:
-                self.waiting_users.remove(data)
-            await self.sync_db()
-            
-            # 3. Update others waiting
-            asyncio.create_task(self.update_positions())
+            # 1. Get next task (priority lane, owner round-robin)
+            async with self._available:
+                await self._available.wait_for(self._has_waiting)
+                data = self._pop_next()
             
             msg = data["msg"]
             chat_id = data["chat_id"]
             owner_id = data["owner_id"]
             handler = data["handler"]
             
+            # 2. Mark as Active & Sync DB
+            data["started"] = time.monotonic()
+            QUEUE_WAIT.observe(
+                (datetime.utcnow() - data["enqueued_at"]).total_seconds(), priority=data["priority"]
+            )
+            self.active_tasks[chat_id] = data
+            await Database.mark_queue_job_active(chat_id)
+            
+            # 3. Update others waiting
+            self.update_positions()
+            
             try:
                 await msg.edit("⚙️ **Processing...**")
-                await handler(msg, chat_id, owner_id)
+                # Per-channel lock: sync waits only for this channel, and
+                # auto-cleanup never evicts it while the task runs
+                async with channel_locks.lock(chat_id, holder=handler.__name__):
+                    await handler(msg, chat_id, owner_id, admins=data.get("admins"))
+                # Learn from successful runs only (failures end early)
+                await eta_model.record(
+                    handler.__name__, data.get("workload"), time.monotonic() - data["started"]
+                )
             except Exception as e:
-                LOGGER.error(f"Worker error in {chat_id}: {e}")
+                LOGGER.error(f"Worker #{worker_id} error in {chat_id}: {e}")
                 try:
                     await msg.edit(f"❌ Error: `{e}`")
                 except:
                     pass
             
             # 4. Task Done - Clear Active & Sync DB
-            self.current_task = None
-            await self.sync_db()
-            
-            self.queue.task_done()
-            LOGGER.info("⏳ Cooling down for 10s before next task...")
-            await asyncio.sleep(10)
+            self.active_tasks.pop(chat_id, None)
+            await Database.delete_queue_job(chat_id)
+            self.update_positions()
 
 queue_manager = QueueManager()
+
+QUEUE_DEPTH.callback = lambda: {(priority,): count for priority, count in queue_manager.lane_sizes().items()}
+QUEUE_ACTIVE.callback = lambda: {(): len(queue_manager.active_tasks)}
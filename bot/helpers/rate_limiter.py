@@ -0,0 +1,139 @@
+import asyncio
+import time
+from config import Config
+
+class TokenBucket:
+    """
+    Async token bucket.
+    - Refills `rate` tokens per second up to `capacity`.
+    - Waiters are served in FIFO order.
+    - `pause()` blocks every waiter (e.g. after a FloodWait).
+    """
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds):
+        """Hold all callers for `seconds` (extends, never shortens, a pause)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        # Nothing may be spent during the pause, so don't bank tokens for it
+        self.tokens = 0
+
+    @property
+    def paused_for(self):
+        return max(0, self.paused_until - time.monotonic())
+
+    async def acquire(self, tokens=1):
+        """Wait until `tokens` are available and consume them"""
+        tokens = min(tokens, self.capacity)
+        async with self._lock:
+            while True:
+                if self.paused_for > 0:
+                    await asyncio.sleep(self.paused_for)
+                    self.updated = time.monotonic()
+                    continue
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+# Clients
+BOT = "bot"
+HELPER = "helper"
+
+# Method classes
+JOIN = "join"          # join / leave channels
+PROMOTE = "promote"    # admin writes: promote, ban, add members, invite links
+RESOLVE = "resolve"    # username resolution
+READ = "read"          # Get*/Search* reads
+EDIT = "edit"          # message sends / edits
+SYNC = "sync"          # one channel step of /sync or /syncarchive (logical)
+
+# Raw function name -> method class
+METHOD_CLASSES = {
+    "channels.JoinChannel": JOIN,
+    "channels.LeaveChannel": JOIN,
+    "messages.ImportChatInvite": JOIN,
+    "channels.EditAdmin": PROMOTE,
+    "channels.EditBanned": PROMOTE,
+    "channels.InviteToChannel": PROMOTE,
+    "messages.ExportChatInvite": PROMOTE,
+    "contacts.ResolveUsername": RESOLVE,
+    "messages.EditMessage": EDIT,
+    "messages.SendMessage": EDIT,
+    "messages.SendMedia": EDIT,
+    "messages.ForwardMessages": EDIT,
+}
+READ_PREFIXES = ("Get", "Search", "Check")
+# Internal plumbing (updates, config) is never throttled
+UNLIMITED_NAMESPACES = ("updates", "help", "auth")
+
+def every(seconds):
+    """One token per `seconds` (None = unlimited, for intervals of 0)"""
+    return (1 / seconds, 1) if seconds > 0 else None
+
+# (client, method class) -> (tokens per second, burst); None = not limited
+LIMITS = {
+    (HELPER, JOIN): every(Config.HELPER_JOIN_INTERVAL),
+    (HELPER, PROMOTE): (Config.HELPER_WRITE_RATE, Config.HELPER_WRITE_BURST),
+    (HELPER, RESOLVE): (0.2, 3),
+    (HELPER, READ): (3, 10),
+    (HELPER, EDIT): (1, 3),
+    (HELPER, SYNC): every(Config.SYNC_CHANNEL_DELAY),
+    (BOT, PROMOTE): (2, 5),
+    (BOT, RESOLVE): (1, 5),
+    (BOT, READ): (20, 30),
+    (BOT, EDIT): (20, 30),
+}
+
+def query_name(query):
+    """'channels.JoinChannel' style name of a raw function"""
+    name = getattr(query, "QUALNAME", None) or type(query).__name__
+    return name[len("functions."):] if name.startswith("functions.") else name
+
+def classify(query):
+    """Method class of a raw function (None = not rate limited)"""
+    name = query_name(query)
+    if name in METHOD_CLASSES:
+        return METHOD_CLASSES[name]
+    namespace, _, method = name.rpartition(".")
+    if namespace in UNLIMITED_NAMESPACES:
+        return None
+    if method.startswith(READ_PREFIXES):
+        return READ
+    return None
+
+class RateLimiter:
+    """
+    One budget per (client, method class), shared by every caller.
+    - A FloodWait seen by one caller pauses the whole class.
+    """
+    def __init__(self, limits):
+        self.buckets = {
+            key: TokenBucket(*limit) for key, limit in limits.items() if limit
+        }
+
+    def bucket(self, client, method_class):
+        return self.buckets.get((client, method_class))
+
+    async def acquire(self, client, method_class, tokens=1):
+        bucket = self.bucket(client, method_class)
+        if bucket:
+            await bucket.acquire(tokens)
+
+    def pause(self, client, method_class, seconds):
+        bucket = self.bucket(client, method_class)
+        if bucket:
+            bucket.pause(seconds)
+
+rate_limiter = RateLimiter(LIMITS)
@@ -0,0 +1,394 @@
+import asyncio
+from datetime import datetime, timedelta
+from bot.client import Clients
+from bot.helpers.channel_manager import ChannelManager
+from bot.helpers.locks import channel_locks
+from bot.helpers.database import Database
+from bot.helpers.rate_limiter import (
+    rate_limiter, LIMITS, BOT, HELPER, SYNC, JOIN, PROMOTE, RESOLVE, READ
+)
+from config import Config
+from bot.utils.logger import LOGGER
+
+# Planned channels buffered between the read and write stages
+PIPELINE_BUFFER = 50
+# Channels per channels.GetChannels liveness request
+LIVENESS_BATCH = 100
+
+def get_leave_delay(bots_count):
+    """Adaptive wait before the helper leaves a channel it joined for sync"""
+    if bots_count < 5:
+        return 30
+    elif 5 <= bots_count < 10:
+        return 25
+    elif 10 <= bots_count < 20:
+        return 20
+    else:
+        return 10
+
+async def stream_live(items, on_dead):
+    """
+    Yield only items whose channel still exists.
+    - Checks LIVENESS_BATCH channels per request (ChannelManager.find_dead_channels).
+    - Each batch's dead ids go to on_dead(ids) at once (bulk cleanup).
+    - Channels outside the -100 id range are passed through unchecked.
+    """
+    batch = []
+    async for item in items:
+        batch.append(item)
+        if len(batch) >= LIVENESS_BATCH:
+            for live in await _split_live(batch, on_dead):
+                yield live
+            batch = []
+    if batch:
+        for live in await _split_live(batch, on_dead):
+            yield live
+
+async def _split_live(batch, on_dead):
+    ids = [item["channel_id"] for item in batch if str(item["channel_id"]).startswith("-100")]
+    dead = await ChannelManager.find_dead_channels(ids)
+    if dead:
+        await on_dead(sorted(dead))
+    return [item for item in batch if item["channel_id"] not in dead]
+
+# Fixed sleeps inside the /sync write stage
+REJOIN_SETTLE = 10      # wait after the helper rejoins
+ADD_MEMBER_PAUSE = 0.5  # pause after add_chat_members
+
+async def estimate_sync(wanted):
+    """
+    Dry-run cost of a /sync towards `wanted` (Mongo only, no Telegram calls).
+    - RPC counts per raw method, as issued by the sync read/write stages.
+    - Admin lists are only fetched when the cached snapshot is stale, invite
+      links only exported when none is stored; membership comes from the
+      local index (no call).
+    - ETA = slowest helper budget (LIMITS) + serialized sleeps + last leave.
+    """
+    wanted = set(wanted)
+    plan = {
+        "channels": 0, "adds": 0, "removes": 0, "rejoins": 0,
+        "bots_added": 0, "bots_removed": 0, "admin_fetches": 0, "rpc": {}, "eta": 0,
+    }
+    rpc = plan["rpc"]
+    resolved = set()
+    longest_leave = 0
+    fresh_admins = await Database.get_fresh_admin_snapshot_ids(
+        datetime.utcnow() - timedelta(seconds=Config.ADMIN_SNAPSHOT_TTL)
+    )
+    invite_links = await Database.get_invite_link_ids()
+
+    def count(method, n=1):
+        if n:
+            rpc[method] = rpc.get(method, 0) + n
+
+    async for ch in Database.iter_channels_needing_sync(wanted):
+        current = set(ch.get("installed_bots", []))
+        to_add = wanted - current
+        to_remove = current - wanted
+        plan["channels"] += 1
+        plan["adds"] += bool(to_add)
+        plan["removes"] += bool(to_remove)
+        plan["bots_added"] += len(to_add)
+        plan["bots_removed"] += len(to_remove)
+        resolved |= to_add | to_remove
+
+        # Read stage
+        if to_add and ch["channel_id"] not in fresh_admins:
+            plan["admin_fetches"] += 1
+            count("channels.GetParticipants")  # bot: admin list (cache miss)
+
+        # Write stage
+        if not ch.get("user_is_member"):
+            plan["rejoins"] += 1
+            if ch["channel_id"] not in invite_links:
+                count("messages.ExportChatInvite")  # bot: first invite link
+            count("messages.ImportChatInvite")  # helper join
+            count("channels.EditAdmin")         # bot promotes helper
+            count("channels.LeaveChannel")      # deferred leave
+            longest_leave = max(longest_leave, get_leave_delay(len(to_add)))
+        count("channels.InviteToChannel", len(to_add))
+        count("channels.EditAdmin", len(to_add) + len(to_remove))
+        count("channels.EditBanned", 2 * len(to_remove))
+
+    count("contacts.ResolveUsername", len(resolved))
+
+    # Helper budgets drain in parallel; the slowest one bounds the run
+    def drain(key, tokens):
+        if not LIMITS.get(key):
+            return 0
+        rate, burst = LIMITS[key]
+        return max(0, tokens - burst) / rate
+
+    helper_promotes = (
+        rpc.get("channels.InviteToChannel", 0)
+        + rpc.get("channels.EditAdmin", 0) - plan["rejoins"]
+        + rpc.get("channels.EditBanned", 0)
+    )
+    budgets = {
+        "channel steps": drain((HELPER, SYNC), plan["channels"]),
+        "admin writes": drain((HELPER, PROMOTE), helper_promotes),
+        "joins/leaves": drain((HELPER, JOIN), 2 * plan["rejoins"]),
+        "username lookups": drain((HELPER, RESOLVE), len(resolved)),
+        "admin list reads": drain((BOT, READ), plan["admin_fetches"]),
+    }
+    sleeps = REJOIN_SETTLE * plan["rejoins"] + ADD_MEMBER_PAUSE * plan["bots_added"]
+    plan["budgets"] = budgets
+    plan["bottleneck"] = max(budgets, key=budgets.get)
+    plan["eta"] = budgets[plan["bottleneck"]] + sleeps + longest_leave
+    return plan
+
+# kind -> async runner(job, status_message), registered by the sync modules
+SYNC_RUNNERS = {}
+
+class SyncJob:
+    """
+    Persisted sync run (one `sync_jobs` document).
+    - counts: progress counters, restored on resume.
+    - cursor: low-watermark channel_id; every channel up to it is finished.
+    - Per-channel outcomes go to `sync_outcomes`, so channels finished past
+      the cursor (concurrent planning) are not touched again on resume.
+    - phase: runs made of several streams (e.g. members, then rejoins) keep
+      one cursor per phase, reset when the phase changes.
+    """
+    def __init__(self, job_id, kind, total, cursor=None, counts=None, chat_id=None, phase=None):
+        self.id = job_id
+        self.kind = kind
+        self.total = total
+        self.phase = phase
+        self.cursor = cursor
+        self.counts = counts or {}
+        self.chat_id = chat_id
+        self.finished = set()
+        self.in_flight = {}  # channel_id -> outcome (None while running), stream order
+        self.outcomes = {}
+
+    @classmethod
+    async def create(cls, kind, chat_id, total, counts):
+        job_id = await Database.create_sync_job(kind, chat_id, total)
+        return cls(job_id, kind, total, counts=counts, chat_id=chat_id)
+
+    @classmethod
+    async def from_doc(cls, doc, counts):
+        counts.update(doc.get("counts") or {})
+        job = cls(
+            doc["_id"], doc["kind"], doc.get("total", 0), doc.get("cursor"),
+            counts, doc.get("chat_id"), doc.get("phase")
+        )
+        # Later phases may meet channels finished in an earlier one
+        after = job.cursor if job.phase is None else None
+        job.finished = await Database.get_sync_outcome_ids(job.id, after=after)
+        return job
+
+    def skip(self, channel_id):
+        """True if this run already finished the channel before a restart"""
+        return channel_id in self.finished
+
+    def begin(self, channel_id):
+        self.in_flight[channel_id] = None
+
+    def outcome(self, channel_id, outcome, error=None):
+        """Record what happened to a channel (saved when it finishes)"""
+        self.outcomes[channel_id] = (outcome, error)
+
+    async def finish(self, channel_id):
+        outcome, error = self.outcomes.pop(channel_id, ("skipped", None))
+        await Database.save_sync_outcome(self.id, channel_id, outcome, error)
+        self.finished.add(channel_id)
+        
+        # Advance the checkpoint over the finished prefix of the stream
+        self.in_flight[channel_id] = outcome
+        for key in list(self.in_flight):
+            if self.in_flight[key] is None:
+                break
+            del self.in_flight[key]
+            self.cursor = key
+        await self.save()
+
+    async def record_many(self, channel_ids, outcome):
+        """Finish channels that never entered the pipeline (e.g. bulk-deleted)"""
+        channel_ids = [c for c in channel_ids if c not in self.finished]
+        await Database.save_sync_outcomes(self.id, channel_ids, outcome)
+        self.finished.update(channel_ids)
+        await self.save()
+
+    async def start_phase(self, phase):
+        """Move to `phase` (no-op when resuming inside it)"""
+        if self.phase == phase:
+            return
+        self.phase = phase
+        self.cursor = None
+        self.in_flight.clear()
+        await self.save()
+
+    async def save(self, status=None):
+        if self.id is None:
+            return
+        fields = {"cursor": self.cursor, "counts": dict(self.counts), "phase": self.phase}
+        if status:
+            fields["status"] = status
+        await Database.update_sync_job(self.id, fields)
+
+class SilentStatus:
+    """Status message stand-in for a resumed run whose notice could not be sent"""
+    async def edit(self, text):
+        pass
+
+async def resume_sync_jobs():
+    """Continue /sync and /syncarchive runs interrupted by a restart"""
+    for doc in await Database.get_running_sync_jobs():
+        runner = SYNC_RUNNERS.get(doc.get("kind"))
+        if not runner:
+            continue
+        LOGGER.info(f"♻️ Resuming {doc['kind']} sync from channel {doc.get('cursor')}")
+        try:
+            status = await Clients.bot.send_message(
+                doc["chat_id"], f"♻️ **Resuming {doc['kind']} sync after restart...**"
+            )
+        except Exception as e:
+            # Still resume: a job left "running" would block new runs of its kind
+            LOGGER.error(f"Failed to send sync resume notice, resuming silently: {e}")
+            status = SilentStatus()
+        asyncio.create_task(runner(doc, status))
+
+class SyncPipeline:
+    """
+    Two-stage sync engine.
+    - Plan stage: bot-side reads (get_chat, admin lists, diffing) run ahead
+      with bounded parallelism (SYNC_READ_CONCURRENCY).
+    - Write stage: helper-side writes run one channel at a time, paced by
+      the shared rate limiter (SYNC step + join/promote budgets), each under
+      that channel's lock (waits only for a setup on the same channel).
+    - Leaves after a temporary join are deferred, so the writer moves on
+      while the leave delay runs.
+    """
+    def __init__(self, plan, apply, name="SYNC", on_pause=None, job=None):
+        # plan(item) -> work or None (nothing to write); apply(work) -> None
+        # on_pause(chat_id) is awaited when the writer must wait for a setup
+        # holding that channel
+        # job (SyncJob) checkpoints each item["channel_id"] once it is done
+        self.plan = plan
+        self.apply = apply
+        self.name = name
+        self.on_pause = on_pause
+        self.job = job
+        self.pending_leaves = set()
+
+    async def run(self, items):
+        """Process `items` (iterable or async iterable) through both stages"""
+        planned = asyncio.Queue(maxsize=PIPELINE_BUFFER)
+        
+        # No end-of-stream sentinel: the writer stops once the producer task
+        # is done and the queue is drained, so a writer that stops early can
+        # never leave the producer blocked on a full queue.
+        producer = asyncio.create_task(self._produce(items, planned))
+        getter = None
+        try:
+            while True:
+                if producer.done() and planned.empty():
+                    producer.result()  # re-raises a failed item source
+                    break
+                getter = asyncio.ensure_future(planned.get())
+                await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                key, work = getter.result()
+                await self._write(key, work)
+                await self._finish(key)
+        finally:
+            if getter:
+                getter.cancel()
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            if self.pending_leaves:
+                LOGGER.info(f"[{self.name}] ⏳ Waiting for {len(self.pending_leaves)} deferred leave(s)...")
+                await asyncio.gather(*self.pending_leaves, return_exceptions=True)
+
+    async def _produce(self, items, planned):
+        semaphore = asyncio.Semaphore(max(1, Config.SYNC_READ_CONCURRENCY))
+        tasks = set()
+
+        def spawn(item):
+            task = asyncio.create_task(plan_one(item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        async def plan_one(item):
+            key = item.get("channel_id")
+            try:
+                try:
+                    work = await self.plan(item)
+                except Exception as e:
+                    LOGGER.error(f"[{self.name}] Planning failed for {item}: {e}")
+                    work = None
+                # Nothing to write: the channel is done as soon as it is planned
+                if work is None:
+                    await self._finish(key)
+                else:
+                    await planned.put((key, work))
+            finally:
+                semaphore.release()
+
+        async def feed(item):
+            if self.job:
+                if self.job.skip(item.get("channel_id")):
+                    return
+                self.job.begin(item.get("channel_id"))
+            await semaphore.acquire()
+            spawn(item)
+
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await feed(item)
+            else:
+                for item in items:
+                    await feed(item)
+            await asyncio.gather(*list(tasks))
+        finally:
+            for task in list(tasks):
+                task.cancel()
+
+    async def _finish(self, key):
+        if self.job:
+            await self.job.finish(key)
+
+    async def _write(self, key, work):
+        # --- PER-CHANNEL LOCK ---
+        # Only waits when a setup/queue task holds this very channel
+        if channel_locks.is_locked(key) and self.on_pause:
+            await self.on_pause(key)
+        async with channel_locks.lock(key, holder=self.name):
+            # Channel spacing shared by /sync and /syncarchive (SYNC_CHANNEL_DELAY)
+            await rate_limiter.acquire(HELPER, SYNC)
+            try:
+                await self.apply(work)
+            except Exception as e:
+                LOGGER.error(f"[{self.name}] Write stage failed: {e}")
+
+    def leave_later(self, chat_id, delay, on_left=None, on_done=None):
+        """
+        Leave `chat_id` after `delay` seconds without blocking the writer.
+        - on_left(chat_id): awaited after a successful leave.
+        - on_done(): called once the attempt is over, whatever the result.
+        """
+        task = asyncio.create_task(self._leave_after(chat_id, delay, on_left))
+        self.pending_leaves.add(task)
+        task.add_done_callback(self.pending_leaves.discard)
+        if on_done:
+            task.add_done_callback(lambda _: on_done())
+
+    async def _leave_after(self, chat_id, delay, on_left):
+        LOGGER.info(f"[{self.name}] ⏳ Leaving {chat_id} in {delay}s...")
+        await asyncio.sleep(delay)
+        if channel_locks.is_locked(chat_id):
+            # A setup took the channel over meanwhile; membership is its call now
+            LOGGER.info(f"[{self.name}] Skipping leave of {chat_id} (held by {channel_locks.holders.get(chat_id)})")
+            return
+        try:
+            await Clients.user_app.leave_chat(chat_id)
+            LOGGER.info(f"[{self.name}] 🚪 Helper left {chat_id}")
+            if on_left:
+                await on_left(chat_id)
+        except Exception as e:
+            LOGGER.warning(f"[{self.name}] Helper failed to leave {chat_id}: {e}")
@@ -1,17 +1,27 @@
 import asyncio
 from aiohttp import web, ClientSession
 from config import Config
+from bot.helpers.metrics import registry, HELPER_MEMBERSHIP_LIMIT
 from bot.utils.logger import LOGGER
 
 async def health_check(request):
     """Health check endpoint"""
     return web.Response(text="✅ LinkerX is alive")
 
+async def metrics_handler(request):
+    """Prometheus metrics (in-memory only: never touches Mongo or Telegram)"""
+    HELPER_MEMBERSHIP_LIMIT.set(Config.MAX_USER_CHANNELS)
+    return web.Response(
+        text=registry.render(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
 async def start_web_server():
     """Start aiohttp web server for health checks"""
     app = web.Application()
     app.router.add_get("/", health_check)
     app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metrics_handler)
     runner = web.AppRunner(app)
     await runner.setup()
     site = web.TCPSite(runner, "0.0.0.0", Config.PORT)
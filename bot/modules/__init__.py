@@ -5,3 +5,5 @@ from . import sync
 from . import stats
 from . import restart
 from . import archive
+from . import apistats
+from . import evictsim
@@ -0,0 +1,50 @@
+from datetime import timedelta
+from pyrogram import filters
+from bot.client import Clients
+from bot.helpers.api_stats import api_stats
+from config import Config
+from bot.utils.logger import LOGGER
+
+WINDOWS = (("Last Hour", timedelta(hours=1)), ("Last Day", timedelta(days=1)))
+
+def format_rows(rows, value_label):
+    if not rows:
+        return "• No data\n"
+    text = ""
+    for i, row in enumerate(rows, 1):
+        key = row["_id"]
+        callers = ", ".join(c.replace("bot.", "") for c in sorted(row["callers"])[:2])
+        if value_label == "time":
+            value = f"{row['total_time']:.1f}s in {row['count']} calls"
+        else:
+            value = f"{row['flood_seconds']}s in {row['flood_waits']} waits"
+        text += f"{i}. `{key['client']}` {key['method']}: {value}\n   ↳ {callers}\n"
+    return text
+
+@Clients.bot.on_message(filters.command("apistats") & filters.user(Config.OWNER_ID))
+async def api_stats_handler(client, message):
+    """Show top Telegram calls by time and FloodWait seconds (Owner only)"""
+    if Config.OWNER_ID == 0:
+        await message.reply_text("❌ This command is disabled (OWNER_ID not set)")
+        return
+    
+    status = await message.reply_text("📡 Fetching API stats...")
+    
+    try:
+        text = "📡 **Telegram API Stats**\n"
+        for label, window in WINDOWS:
+            by_time = await api_stats.top_calls(window, "total_time")
+            by_flood = await api_stats.top_calls(window, "flood_seconds")
+            text += (
+                f"\n**🕒 {label} — Top by Total Time:**\n"
+                f"{format_rows(by_time, 'time')}"
+                f"\n**⏳ {label} — Top by FloodWait:**\n"
+                f"{format_rows(by_flood, 'flood')}"
+            )
+        
+        await status.edit(text)
+        LOGGER.info("API stats command executed successfully")
+    
+    except Exception as e:
+        LOGGER.error(f"/apistats error: {e}")
+        await status.edit(f"❌ **Error:** `{e}`")
@@ -1,22 +1,21 @@
 import asyncio
-from pyrogram import filters, enums
+from pyrogram import filters
 from pyrogram.enums import ChatMemberStatus, ChatType, ChatMembersFilter
 from pyrogram.errors import (
     ChatAdminRequired,
-    UserNotParticipant,
     ChatWriteForbidden,
     FloodWait,
-    ChannelInvalid,
-    PeerIdInvalid,
-    ChannelPrivate,
     UserAlreadyParticipant
 )
 from datetime import datetime
 from bot.client import Clients
-from bot.helpers.queue import queue_manager
+from bot.helpers.queue import queue_manager, PRIORITY_ARCHIVE
 from bot.helpers.channel_manager import ChannelManager
 from bot.helpers.bot_manager import BotManager
+from bot.helpers.admin_cache import admin_cache
 from bot.helpers.database import Database
+from bot.helpers.metrics import SETUP_STEP, set_sync_progress
+from bot.helpers.sync_engine import SyncPipeline, SyncJob, SYNC_RUNNERS, get_leave_delay, stream_live
 from config import Config
 from bot.utils.logger import LOGGER
 
@@ -24,21 +23,21 @@ from bot.utils.logger import LOGGER
 # 1. LOGIC WORKER (The Main Setup Process)
 # ==================================================================
 
-async def archive_logic(message, chat_id, owner_id):
+async def archive_logic(message, chat_id, owner_id, admins=None):
     """
     Executes the setup logic after queue and permission checks.
+    `admins`: AdminSnapshot taken by /helparchive (skips a re-fetch).
     """
     LOGGER.info(f"=[ARCHIVE] SETUP STARTED for channel {chat_id}=")
     
-    # --- ACTIVATE TRAFFIC LIGHT (PAUSE SYNC) ---
-    ChannelManager.ACTIVE_SETUPS.add(chat_id)
-    
+    # The queue worker holds this channel's lock (sync waits on it)
     try:
         # 1. Add Helper
         await message.edit("➕ **Preparing helper account with FULL access...**")
         LOGGER.info(f"[ARCHIVE] Adding helper to {chat_id}")
         
-        await ChannelManager.add_helper_to_channel(chat_id, message)
+        with SETUP_STEP.time(handler="archive", step="add_helper"):
+            await ChannelManager.add_helper_to_channel(chat_id, message)
         
         # SAFETY: Wait for permissions to sync across DCs
         LOGGER.info("[ARCHIVE] ⏳ Waiting 15s for permissions to propagate...")
@@ -48,13 +47,17 @@ async def archive_logic(message, chat_id, owner_id):
         await message.edit("🤖 **Adding archive bots...**")
         LOGGER.info(f"[ARCHIVE] Starting bot installation via Userbot")
         
-        successful, failed = await BotManager.process_bots(
-            chat_id, "add", Config.BOTS_TO_ADD, message
-        )
+        with SETUP_STEP.time(handler="archive", step="add_bots"):
+            admins = await admin_cache.reuse(admins, chat_id)
+            successful, failed = await BotManager.process_bots(
+                chat_id, "add", Config.BOTS_TO_ADD, message,
+                existing_admins=admins.usernames() if admins else None
+            )
         
         # 3. Save to DB
         LOGGER.info(f"[ARCHIVE] Saving to Archive DB")
-        await Database.save_archive_setup(chat_id, owner_id, successful)
+        with SETUP_STEP.time(handler="archive", step="save_db"):
+            await Database.save_archive_setup(chat_id, owner_id, successful)
         
         # 4. Result Message
         text = (
@@ -78,6 +81,7 @@ async def archive_logic(message, chat_id, owner_id):
         try:
             await Clients.user_app.leave_chat(chat_id)
             LOGGER.info(f"[ARCHIVE] ✅ Helper left successfully")
+            await ChannelManager.mark_helper_left(chat_id, reason="archive")
         except Exception as e:
             LOGGER.error(f"[ARCHIVE] ❌ Helper failed to leave: {e}")
 
@@ -88,10 +92,6 @@ async def archive_logic(message, chat_id, owner_id):
         try: await message.edit(f"❌ **Archive Error:** `{e}`")
         except: pass
         raise
-        
-    finally:
-        # --- DEACTIVATE TRAFFIC LIGHT (RESUME SYNC) ---
-        ChannelManager.ACTIVE_SETUPS.discard(chat_id)
 
 # ==================================================================
 # 2. HELP ARCHIVE COMMAND (Trigger)
@@ -110,9 +110,11 @@ async def help_archive_handler(client, message):
 
     chat_id = message.chat.id
 
-    # Check Queue
-    if queue_manager.get_position(chat_id):
-        try: await message.reply_text("⚠️ This channel is already in queue.")
+    # Check Queue (merge into an existing queued/running task)
+    if queue_manager.find(chat_id):
+        try:
+            status = await message.reply_text("🔍 **Checking queue...**")
+            await queue_manager.merge_request(chat_id, status)
         except: pass
         return
 
@@ -211,21 +213,20 @@ async def help_archive_handler(client, message):
                  await message.reply_text(caption + "\n\n*(Visual guide unavailable)*")
             return
 
-        # Find Owner
+        # Find Owner (one admin snapshot, carried to the worker)
         LOGGER.info("[DEBUG] Permissions OK. Finding owner...")
-        owner_id = 0
-        try:
-            async for admin in client.get_chat_members(chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
-                if admin.status == enums.ChatMemberStatus.OWNER:
-                    owner_id = admin.user.id
-                    LOGGER.info(f"[DEBUG] Owner found: {owner_id}")
-                    break
-        except Exception as e:
-            LOGGER.warning(f"[DEBUG] Owner check failed: {e}")
+        admins = await admin_cache.fetch(chat_id)
+        owner_id = admins.owner_id if admins and admins.owner_id else 0
+        if owner_id:
+            LOGGER.info(f"[DEBUG] Owner found: {owner_id}")
+        else:
+            LOGGER.warning(f"[DEBUG] Owner check failed for {chat_id}")
 
         # Add to Queue
         LOGGER.info("[DEBUG] Adding to processing queue...")
-        await queue_manager.add_to_queue(status, chat_id, owner_id, archive_logic)
+        await queue_manager.add_to_queue(
+            status, chat_id, owner_id, archive_logic, priority=PRIORITY_ARCHIVE, admins=admins
+        )
 
     except Exception as e:
         LOGGER.error("CRITICAL CRASH in helparchive", exc_info=True)
@@ -240,152 +241,175 @@ async def help_archive_handler(client, message):
 async def sync_archive_handler(client, message):
     """
     Advanced Maintenance with Multi-Tier Adaptive Throttling.
+    - Existence is checked in batches (one request per 100 channels);
+      dead channels are removed with one bulk delete per batch.
+    - Admin checks (Bot reads) are planned ahead concurrently.
+    - Repairs (Helper writes) run one channel at a time through the rate budget.
+    - Progress is checkpointed; an interrupted run resumes after restart.
     """
+    if await Database.get_running_sync_jobs("archive"):
+        await message.reply_text("⏳ An archive sync is already running.")
+        return
+    
     status = await message.reply_text("♻️ **Starting Smart Archive Sync...**")
+    await run_archive_sync(None, status)
+
+async def run_archive_sync(job_doc, status):
+    """Run (or resume, given its `sync_jobs` document) an archive sync"""
+    counts = {"processed": 0, "deleted": 0, "repaired": 0, "skipped": 0}
     
-    channels = await Database.get_all_archive_channels()
-    total = len(channels)
-    processed = 0
-    deleted = 0
-    repaired = 0
-    skipped = 0
+    if job_doc:
+        job = await SyncJob.from_doc(job_doc, counts)
+        total = job.total
+    else:
+        total = await Database.count_archive_channels()
+        job = await SyncJob.create("archive", status.chat.id, total, counts)
     
-    LOGGER.info(f"[SYNC-ARCHIVE] Started Smart Sync for {total} channels")
+    LOGGER.info(f"[SYNC-ARCHIVE] Started Smart Sync for {total} channels (from {job.cursor})")
 
     required_bots = {bot.lstrip('@').lower() for bot in Config.BOTS_TO_ADD}
 
-    for channel_data in channels:
-        
-        # --- PAUSE LOGIC ---
-        while len(ChannelManager.ACTIVE_SETUPS) > 0:
-            LOGGER.info(f"[SYNC] ⏸️ Paused due to active setup...")
-            try: await status.edit(f"⏸️ **Paused...**\nPriority Setup Running.")
-            except: pass
-            await asyncio.sleep(5)
-        # -------------------
-
+    async def report_progress():
+        set_sync_progress(
+            "archive", total=total, processed=counts["processed"],
+            deleted=counts["deleted"], repaired=counts["repaired"], healthy=counts["skipped"]
+        )
+        try: 
+            await status.edit(
+                f"♻️ **Smart Syncing...**\n"
+                f"Progress: `{counts['processed']}/{total}`\n"
+                f"🗑 Deleted: `{counts['deleted']}`\n"
+                f"🔧 Repaired: `{counts['repaired']}`\n"
+                f"✅ OK: `{counts['skipped']}`"
+            )
+        except Exception as e:
+            LOGGER.warning(f"Status update failed: {e}")
+
+    async def on_dead(chat_ids):
+        """STEP A: dead channels found by the batched liveness scan"""
+        LOGGER.warning(f"[SYNC] 🗑 {len(chat_ids)} dead channel(s). Removing from DB.")
+        deleted = await Database.delete_archive_channels(chat_ids)
+        counts["processed"] += len(chat_ids)
+        counts["deleted"] += deleted
+        await job.record_many(chat_ids, "deleted")
+
+    async def plan(channel_data):
+        """Read stage: bot status, helper membership (channel known to exist)"""
         chat_id = channel_data.get("channel_id")
-        processed += 1
+        counts["processed"] += 1
         
         # Update status on 1st channel, then every 5th channel
-        if processed == 1 or processed % 5 == 0:
-            try: 
-                await status.edit(
-                    f"♻️ **Smart Syncing...**\n"
-                    f"Progress: `{processed}/{total}`\n"
-                    f"🗑 Deleted: `{deleted}`\n"
-                    f"🔧 Repaired: `{repaired}`\n"
-                    f"✅ OK: `{skipped}`"
-                )
-            except Exception as e:
-                LOGGER.warning(f"Status update failed: {e}")
+        if counts["processed"] == 1 or counts["processed"] % 5 == 0:
+            await report_progress()
+
+        # STEP B: CHECK BOT STATUS
+        # Verified healthy within ADMIN_SNAPSHOT_TTL: skip without any call
+        snapshot = await admin_cache.get(chat_id)
+        if snapshot and snapshot.is_fresh() and required_bots <= snapshot.usernames(bots_only=True):
+            counts["skipped"] += 1
+            job.outcome(chat_id, "recently_verified")
+            return None
+        
+        # Conditional fetch: "not modified" when the admin list is unchanged
+        snapshot = await admin_cache.fetch(chat_id, snapshot)
+        current_bots = snapshot.usernames(bots_only=True) if snapshot else set()
+        
+        missing_bots = required_bots - current_bots
+        helper_in_chat = await ChannelManager.check_helper_membership(chat_id)
+        
+        if not missing_bots:
+            await Database.archive_channels.update_one(
+                {"channel_id": chat_id},
+                {"$set": {"last_updated": datetime.utcnow()}}
+            )
+            counts["skipped"] += 1
+            job.outcome(chat_id, "healthy")
+            # Healthy: only a leftover helper membership needs a write
+            if not helper_in_chat:
+                return None
+        
+        return {
+            "chat_id": chat_id,
+            "missing_bots": missing_bots,
+            "helper_in_chat": helper_in_chat,
+        }
 
-        try:
-            # STEP A: EXISTENCE CHECK
-            try:
-                await Clients.bot.get_chat(chat_id)
-            except (ChannelInvalid, PeerIdInvalid, ChannelPrivate):
-                LOGGER.warning(f"[SYNC] 🗑 Channel {chat_id} is dead. Removing from DB.")
-                await Database.archive_channels.delete_one({"channel_id": chat_id})
-                deleted += 1
-                continue 
-            except Exception as e:
-                LOGGER.error(f"[SYNC] ⚠️ Error accessing {chat_id}: {e}")
-                continue
+    async def mark_left(chat_id):
+        await ChannelManager.mark_helper_left(chat_id, reason="archive")
 
-            # STEP B: CHECK BOT STATUS
-            current_bots = set()
-            try:
-                async for member in Clients.bot.get_chat_members(chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
-                    if member.user.is_bot:
-                        current_bots.add(member.user.username.lower())
-            except Exception as e:
-                LOGGER.warning(f"[SYNC] Could not fetch admins for {chat_id}: {e}")
-            
-            missing_bots = required_bots - current_bots
-            
-            if not missing_bots:
-                await Database.archive_channels.update_one(
-                    {"channel_id": chat_id},
-                    {"$set": {"last_updated": datetime.utcnow()}}
-                )
-                skipped += 1
-                try:
-                    await Clients.user_app.leave_chat(chat_id)
-                    LOGGER.info(f"[SYNC] Helper removed from healthy channel {chat_id}")
-                except: pass
-                continue
-
-            # STEP C: REPAIR
-            LOGGER.info(f"[SYNC] 🔧 Repairing {chat_id}. Missing: {len(missing_bots)}")
-            
-            helper_me = await Clients.user_app.get_me()
-            helper_in_chat = False
-            
+    async def apply(work):
+        """Write stage: remove helper from healthy channels, or repair"""
+        chat_id = work["chat_id"]
+        missing_bots = work["missing_bots"]
+        
+        if not missing_bots:
             try:
-                await Clients.user_app.get_chat_member(chat_id, "me")
-                helper_in_chat = True
-            except UserNotParticipant:
-                helper_in_chat = False
-            except Exception:
-                helper_in_chat = False
+                await Clients.user_app.leave_chat(chat_id)
+                LOGGER.info(f"[SYNC] Helper removed from healthy channel {chat_id}")
+                await mark_left(chat_id)
+            except: pass
+            return
 
-            if not helper_in_chat:
-                LOGGER.info(f"[SYNC] ➕ Adding Helper to {chat_id}...")
-                try:
-                    await ChannelManager.add_helper_to_channel(chat_id, status_message=None)
-                    
-                    # SAFETY: Wait 10s AFTER JOINING
-                    LOGGER.info("[SYNC] ⏳ Waiting 10s after join...")
-                    await asyncio.sleep(10)
-                except Exception as e:
-                    LOGGER.error(f"[SYNC] ❌ Failed to add Helper to {chat_id}: {e}")
-                    continue 
-
-            bots_to_install = [f"@{b}" for b in missing_bots]
-            
-            try:
-                await BotManager.process_bots(chat_id, "add", bots_to_install, status_msg=None)
-                repaired += 1
-            except Exception as e:
-                LOGGER.error(f"[SYNC] Failed to install bots in {chat_id}: {e}")
+        # STEP C: REPAIR
+        LOGGER.info(f"[SYNC] 🔧 Repairing {chat_id}. Missing: {len(missing_bots)}")
 
-            # --- ADAPTIVE THROTTLING ---
-            bots_count = len(bots_to_install)
-            
-            if bots_count < 5:
-                leave_delay = 30
-            elif 5 <= bots_count < 10:
-                leave_delay = 25
-            elif 10 <= bots_count < 20:
-                leave_delay = 20
-            else:
-                leave_delay = 10
-            
-            LOGGER.info(f"[SYNC] ⏳ Waiting {leave_delay}s before leaving (Batch size: {bots_count})...")
-            await asyncio.sleep(leave_delay) 
-            
+        if not work["helper_in_chat"]:
+            LOGGER.info(f"[SYNC] ➕ Adding Helper to {chat_id}...")
             try:
-                await Clients.user_app.leave_chat(chat_id)
-                LOGGER.info(f"[SYNC] 🚪 Helper left {chat_id}")
+                await ChannelManager.add_helper_to_channel(chat_id, status_message=None)
+                
+                # SAFETY: Wait 10s AFTER JOINING
+                LOGGER.info("[SYNC] ⏳ Waiting 10s after join...")
+                await asyncio.sleep(10)
             except Exception as e:
-                LOGGER.warning(f"[SYNC] Helper failed to leave {chat_id}: {e}")
+                LOGGER.error(f"[SYNC] ❌ Failed to add Helper to {chat_id}: {e}")
+                job.outcome(chat_id, "error", str(e)[:200])
+                return
 
+        bots_to_install = [f"@{b}" for b in missing_bots]
+        
+        try:
+            await BotManager.process_bots(chat_id, "add", bots_to_install, status_msg=None)
+            counts["repaired"] += 1
+            job.outcome(chat_id, "repaired")
         except Exception as e:
-            LOGGER.error(f"[SYNC] Critical error processing {chat_id}: {e}")
+            LOGGER.error(f"[SYNC] Failed to install bots in {chat_id}: {e}")
+            job.outcome(chat_id, "error", str(e)[:200])
+
+        # --- ADAPTIVE THROTTLING (leave runs in the background) ---
+        pipeline.leave_later(
+            chat_id, get_leave_delay(len(bots_to_install)), on_left=mark_left
+        )
 
-        # Rate Limit Protection
-        await asyncio.sleep(Config.SYNC_CHANNEL_DELAY)
+    async def on_pause(chat_id):
+        try: await status.edit(f"⏸️ **Waiting...**\nSetup running in `{chat_id}`.")
+        except: pass
+
+    pipeline = SyncPipeline(plan, apply, name="SYNC-ARCHIVE", on_pause=on_pause, job=job)
+    try:
+        # STEP A (existence) runs in batches ahead of the pipeline
+        await pipeline.run(stream_live(Database.iter_archive_channels(after=job.cursor), on_dead))
+    except Exception as e:
+        LOGGER.error(f"[SYNC-ARCHIVE] Sync failed: {e}")
+        await job.save(status="failed")
+        raise
+    await job.save(status="done")
 
     # Final Report
+    set_sync_progress(
+        "archive", total=total, processed=counts["processed"],
+        deleted=counts["deleted"], repaired=counts["repaired"], healthy=counts["skipped"]
+    )
     await status.edit(
         f"✅ **Smart Sync Complete**\n\n"
         f"📚 Scanned: `{total}`\n"
-        f"🗑 Removed Dead: `{deleted}`\n"
-        f"🔧 Repaired: `{repaired}`\n"
-        f"✅ Already Healthy: `{skipped}`"
+        f"🗑 Removed Dead: `{counts['deleted']}`\n"
+        f"🔧 Repaired: `{counts['repaired']}`\n"
+        f"✅ Already Healthy: `{counts['skipped']}`"
     )
 
+SYNC_RUNNERS["archive"] = run_archive_sync
+
 # ==================================================================
 # 4. STATS ARCHIVE COMMAND
 # ==================================================================
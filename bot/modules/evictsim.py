@@ -0,0 +1,61 @@
+from datetime import datetime, timedelta
+from pyrogram import filters
+from bot.client import Clients
+from bot.helpers.database import Database
+from bot.helpers.capacity import capacity
+from bot.helpers.eviction import POLICIES, simulate
+from config import Config
+from bot.utils.logger import LOGGER
+
+@Clients.bot.on_message(filters.command("evictsim") & filters.user(Config.OWNER_ID))
+async def evict_sim_handler(client, message):
+    """
+    Replay membership history against every eviction policy (Owner only).
+    - `/evictsim [capacity] [days]` (defaults: MAX_USER_CHANNELS, 30 days).
+    """
+    if Config.OWNER_ID == 0:
+        await message.reply_text("❌ This command is disabled (OWNER_ID not set)")
+        return
+    
+    try:
+        args = message.command[1:]
+        limit = int(args[0]) if len(args) > 0 else Config.MAX_USER_CHANNELS
+        days = int(args[1]) if len(args) > 1 else 30
+    except ValueError:
+        await message.reply_text("❌ Usage: `/evictsim [capacity] [days]`")
+        return
+    
+    status = await message.reply_text("🧪 Replaying membership history...")
+    
+    try:
+        since = datetime.utcnow() - timedelta(days=days)
+        events = [ev async for ev in Database.iter_membership_events(since)]
+        if not events:
+            await status.edit("📭 No membership history recorded yet.")
+            return
+        
+        results = {name: simulate(events, limit, name) for name in POLICIES}
+        best = min(results, key=lambda name: results[name]["rejoins"])
+        
+        text = (
+            f"🧪 **Eviction Policy Simulation**\n\n"
+            f"📜 Events: `{len(events)}` (last {days} days)\n"
+            f"📦 Capacity: `{limit}`\n"
+            f"⚙️ Active policy: `{capacity.policy_name}`\n\n"
+        )
+        for name, result in sorted(results.items(), key=lambda x: x[1]["rejoins"]):
+            marker = " 🏆" if name == best else ""
+            text += (
+                f"**{name}**{marker}\n"
+                f"🔄 Rejoins: `{result['rejoins']}` · 🗑 Evictions: `{result['evictions']}` · "
+                f"✅ Hits: `{result['hits']}`\n"
+            )
+        cold = results[best]["cold"]
+        text += f"\n🆕 First-time joins (same for all): `{cold}`"
+        
+        await status.edit(text)
+        LOGGER.info("Eviction simulation executed successfully")
+    
+    except Exception as e:
+        LOGGER.error(f"/evictsim error: {e}")
+        await status.edit(f"❌ **Error:** `{e}`")
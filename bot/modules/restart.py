@@ -7,6 +7,7 @@ from pyrogram import filters
 from bot.client import Clients
 from bot.helpers.database import Database
 from bot.helpers.queue import queue_manager
+from bot.helpers.sync_engine import resume_sync_jobs
 from config import Config
 from bot.utils.logger import LOGGER
 
@@ -34,6 +35,9 @@ async def send_restart_notification():
         # 1. Restore the Queue first (Resume operations)
         await queue_manager.restore_queue()
         
+        # 1b. Resume interrupted /sync and /syncarchive runs
+        await resume_sync_jobs()
+        
         # 2. Notify Owner (Manual Restart Status)
         restart_info = await Database.get_restart_info()
         if restart_info:
@@ -8,17 +8,23 @@ from pyrogram.errors import (
     InputUserDeactivated,
     ChatWriteForbidden
 )
-from pyrogram.enums import ChatMemberStatus, ChatMembersFilter
+from pyrogram.enums import ChatMemberStatus
 from bot.client import Clients
-from bot.helpers.queue import queue_manager
+from bot.helpers.queue import queue_manager, PRIORITY_SETUP
 from bot.helpers.channel_manager import ChannelManager
 from bot.helpers.bot_manager import BotManager
+from bot.helpers.admin_cache import admin_cache
+from bot.helpers.capacity import capacity
 from bot.helpers.database import Database
+from bot.helpers.metrics import SETUP_STEP
 from config import Config
 from bot.utils.logger import LOGGER
 
-async def setup_logic(message, chat_id, owner_id):
-    """Main setup logic - executed by queue worker"""
+async def setup_logic(message, chat_id, owner_id, admins=None):
+    """
+    Main setup logic - executed by queue worker.
+    `admins`: AdminSnapshot taken by /setup (skips a re-fetch).
+    """
     LOGGER.info(f"=" * 60)
     LOGGER.info(f"SETUP STARTED for channel {chat_id}")
     LOGGER.info(f"=" * 60)
@@ -26,7 +32,8 @@ async def setup_logic(message, chat_id, owner_id):
     try:
         # Step 1: Check helper membership
         LOGGER.info(f"[STEP 1] Checking helper membership in {chat_id}")
-        is_member = await ChannelManager.check_helper_membership(chat_id)
+        with SETUP_STEP.time(handler="setup", step="check_membership"):
+            is_member = await ChannelManager.check_helper_membership(chat_id)
         
         if not is_member:
             await message.edit("➕ **Preparing helper account...**")
@@ -34,7 +41,8 @@ async def setup_logic(message, chat_id, owner_id):
             
             try:
                 # Pass 'message' for FloodWait notifications
-                await ChannelManager.add_helper_to_channel(chat_id, message)
+                with SETUP_STEP.time(handler="setup", step="add_helper"):
+                    await ChannelManager.add_helper_to_channel(chat_id, message)
                 LOGGER.info(f"[STEP 2] ✅ Helper successfully added/promoted")
             except Exception as e:
                 LOGGER.error(f"[STEP 2] ❌ FAILED to add helper: {type(e).__name__} - {e}")
@@ -48,7 +56,8 @@ async def setup_logic(message, chat_id, owner_id):
         # Step 3: Verify helper rights
         LOGGER.info(f"[STEP 3] Verifying helper permissions")
         try:
-            helper_member = await Clients.user_app.get_chat_member(chat_id, "me")
+            with SETUP_STEP.time(handler="setup", step="verify_helper"):
+                helper_member = await Clients.user_app.get_chat_member(chat_id, "me")
             can_promote = getattr(helper_member.privileges, "can_promote_members", False) if helper_member.privileges else False
             
             if not can_promote:
@@ -62,9 +71,12 @@ async def setup_logic(message, chat_id, owner_id):
         LOGGER.info(f"[STEP 4] Starting bot installation")
         
         try:
-            successful, failed = await BotManager.process_bots(
-                chat_id, "add", Config.BOTS_TO_ADD, message
-            )
+            with SETUP_STEP.time(handler="setup", step="add_bots"):
+                admins = await admin_cache.reuse(admins, chat_id)
+                successful, failed = await BotManager.process_bots(
+                    chat_id, "add", Config.BOTS_TO_ADD, message,
+                    existing_admins=admins.usernames() if admins else None
+                )
             LOGGER.info(f"[STEP 4] ✅ Bots added - Success: {len(successful)}, Failed: {len(failed)}")
             if failed:
                 LOGGER.warning(f"[STEP 4] Failed bots: {failed}")
@@ -75,7 +87,9 @@ async def setup_logic(message, chat_id, owner_id):
         # Step 5: Save DB
         LOGGER.info(f"[STEP 5] Saving setup")
         try:
-            await Database.save_setup(chat_id, owner_id, successful)
+            with SETUP_STEP.time(handler="setup", step="save_db"):
+                await Database.save_setup(chat_id, owner_id, successful)
+                await capacity.used(chat_id)
         except Exception as e:
             LOGGER.error(f"[STEP 5] ❌ Database save failed: {e}")
             raise
@@ -114,15 +128,11 @@ async def setup_handler(client, message):
         )
         return
     
-    # 1. QUEUE CHECK
+    # 1. QUEUE CHECK (merge into an existing queued/running task)
     try:
-        existing_pos = queue_manager.get_position(target_chat)
-        if existing_pos:
-            await message.reply_text(
-                f"⚠️ **Request Already Queued**\n\n"
-                f"This channel is already in the queue at position **#{existing_pos}**.\n"
-                f"Please wait for the current task to finish."
-            )
+        if queue_manager.find(target_chat):
+            status = await message.reply_text("🔍 **Checking queue...**")
+            await queue_manager.merge_request(target_chat, status)
             return
     except (ChatAdminRequired, ChatWriteForbidden):
         LOGGER.error(f"[SETUP] ❌ Bot lacks Admin/Write rights in {target_chat}")
@@ -132,7 +142,9 @@ async def setup_handler(client, message):
         return
 
     # 2. OWNER ID & INITIAL REPLY
+    # One admin snapshot serves the owner lookup, slot count and the worker
     owner_id = None
+    admins = None
     try:
         if message.from_user:
             owner_id = message.from_user.id
@@ -140,14 +152,12 @@ async def setup_handler(client, message):
         else:
             status = await message.reply_text("🕵️ **Anonymous Admin detected...**\n🔍 Fetching channel owner...")
             try:
-                found_owner = False
-                async for member in Clients.bot.get_chat_members(target_chat, filter=ChatMembersFilter.ADMINISTRATORS):
-                    if member.status == ChatMemberStatus.OWNER:
-                        owner_id = member.user.id
-                        found_owner = True
-                        break
+                admins = await admin_cache.fetch(target_chat)
+                if admins is None:
+                    raise RuntimeError("admin list unavailable")
+                owner_id = admins.owner_id
                 
-                if not found_owner or not owner_id:
+                if not owner_id:
                     await status.edit("❌ **Setup Failed**\n\nCould not identify owner.")
                     return
                 LOGGER.info(f"[SETUP] Anonymous admin resolved to Owner ID: {owner_id}")
@@ -217,13 +227,13 @@ async def setup_handler(client, message):
         # 5. FETCH ADMINS (Limit Check + Completion Check)
         await status.edit("🔍 **Checking admin slots...**")
         
-        current_admin_usernames = set()
-        current_count = 0
+        if admins is None:
+            admins = await admin_cache.fetch(target_chat)
+        if admins is None:
+            raise RuntimeError("Could not read the admin list")
         
-        async for member in Clients.bot.get_chat_members(target_chat, filter=ChatMembersFilter.ADMINISTRATORS):
-            current_count += 1
-            if member.user and member.user.username:
-                current_admin_usernames.add(member.user.username.lower())
+        current_admin_usernames = admins.usernames()
+        current_count = admins.count
         
         # Calculate missing bots
         missing_bots = []
@@ -272,6 +282,9 @@ async def setup_handler(client, message):
     # 6. ADD TO QUEUE
     LOGGER.info(f"[QUEUE] Adding {target_chat} to processing queue")
     try:
-        await queue_manager.add_to_queue(status, target_chat, owner_id, setup_logic)
+        await queue_manager.add_to_queue(
+            status, target_chat, owner_id, setup_logic,
+            priority=PRIORITY_SETUP, workload=len(missing_bots), admins=admins
+        )
     except Exception as e:
         await status.edit(f"❌ **Queue Error:** {str(e)}")
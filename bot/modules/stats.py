@@ -2,6 +2,7 @@ from pyrogram import filters
 from bot.client import Clients
 from bot.helpers.database import Database
 from bot.helpers.queue import queue_manager
+from bot.helpers.eta_model import eta_model
 from config import Config
 from bot.utils.logger import LOGGER
 
@@ -25,6 +26,20 @@ async def stats_handler(client, message):
         bot_username = await Clients.get_bot_username()
         helper_username = await Clients.get_helper_username()
         
+        lanes_text = ", ".join(
+            f"{priority} {count}" for priority, count in queue_manager.lane_sizes().items()
+        )
+        
+        eta_rows = eta_model.summary()
+        if eta_rows:
+            eta_text = "\n".join(
+                f"• {handler.replace('_logic', '')} ({bucket} missing): "
+                f"avg {ewma:.0f}s, p50 {p50:.0f}s, p90 {p90:.0f}s (n={count})"
+                for handler, bucket, count, ewma, p50, p90 in eta_rows
+            )
+        else:
+            eta_text = "• No samples yet"
+        
         text = (
             f"📊 **LinkerX Global Statistics**\n\n"
             f"**📺 Channels:**\n"
@@ -34,8 +49,11 @@ async def stats_handler(client, message):
             f"• Total Installs: {stats['total_bots']}\n"
             f"• Configured Bots: {len(Config.BOTS_TO_ADD)}\n\n"
             f"**⚙️ Queue Status:**\n"
-            f"• Queue Size: {queue_manager.queue.qsize()}\n"
-            f"• Waiting Users: {len(queue_manager.waiting_users)}\n\n"
+            f"• Waiting Users: {len(queue_manager.waiting_users)}\n"
+            f"• Lanes: {lanes_text}\n"
+            f"• Active Tasks: {len(queue_manager.active_tasks)}/{queue_manager.worker_count}\n\n"
+            f"**⏱️ Task Durations (ETA model):**\n"
+            f"{eta_text}\n\n"
             f"**🛡️ Spam Protection:**\n"
             f"• Active Memberships: {active_memberships}/{Config.MAX_USER_CHANNELS}\n"
             f"• Oldest Membership: {stats['oldest_membership']}\n\n"
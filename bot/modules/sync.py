@@ -4,137 +4,258 @@ from bot.client import Clients
 from bot.helpers.database import Database
 from bot.helpers.channel_manager import ChannelManager
 from bot.helpers.bot_manager import BotManager
+from bot.helpers.admin_cache import admin_cache
+from bot.helpers.sync_engine import SyncPipeline, SyncJob, SYNC_RUNNERS, get_leave_delay, estimate_sync
+from bot.helpers.metrics import set_sync_progress
+from bot.helpers.outbox import outbox
+from bot.helpers.capacity import capacity
 from config import Config
 from bot.utils.logger import LOGGER
 
+# (phase, helper already a member?) in run order
+SYNC_PHASES = (("members", True), ("rejoins", False))
+
 @Clients.bot.on_message(filters.command("sync") & filters.user(Config.OWNER_ID))
 async def sync_all_channels(client, message):
-    """Sync all channels with current bot configuration (Owner only)"""
+    """
+    Sync all channels with current bot configuration (Owner only).
+    - Reads (diff, admin list, membership) are planned ahead concurrently.
+    - Helper writes run one channel at a time through the rate budget.
+    - Progress is checkpointed; an interrupted run resumes after restart.
+    """
     if Config.OWNER_ID == 0:
         await message.reply_text("❌ This command is disabled (OWNER_ID not set)")
         return
     
-    status = await message.reply_text("🔄 **Global Sync Started...**")
+    if await Database.get_running_sync_jobs("main"):
+        await message.reply_text("⏳ A global sync is already running.")
+        return
     
-    processed = 0
-    errors = 0
-    rejoined = 0
+    status = await message.reply_text("🔄 **Global Sync Started...**")
+    await run_main_sync(None, status)
+
+async def run_main_sync(job_doc, status):
+    """Run (or resume, given its `sync_jobs` document) a global sync"""
+    counts = {"scanned": 0, "processed": 0, "errors": 0, "rejoined": 0}
+    wanted = set(Config.BOTS_TO_ADD)
+    job = None
     
     try:
-        channels = await Database.get_all_channels()
-        total = len(channels)
+        if job_doc:
+            job = await SyncJob.from_doc(job_doc, counts)
+            total = job.total
+        else:
+            # Only channels whose installed_bots differ from BOTS_TO_ADD are streamed
+            total = await Database.count_channels_needing_sync(wanted)
+            
+            if total == 0:
+                await status.edit("📭 All channels are already in sync.")
+                return
+            
+            job = await SyncJob.create("main", status.chat.id, total, counts)
         
-        if total == 0:
-            await status.edit("📭 No channels to sync.")
-            return
+        LOGGER.info(f"Starting sync for {total} channels (from {job.cursor})")
         
-        LOGGER.info(f"Starting sync for {total} channels")
+        async def report_progress():
+            set_sync_progress(
+                "main", total=total, processed=counts["scanned"],
+                updated=counts["processed"], rejoined=counts["rejoined"], errors=counts["errors"]
+            )
+            try:
+                await status.edit(
+                    f"🔄 **Syncing...**\n\n"
+                    f"Progress: {counts['scanned']}/{total}\n"
+                    f"✅ Updated: {counts['processed']}\n"
+                    f"🔄 Rejoined: {counts['rejoined']}\n"
+                    f"❌ Errors: {counts['errors']}"
+                )
+            except Exception as e:
+                LOGGER.warning(f"Status update failed: {e}")
         
-        for idx, ch in enumerate(channels, 1):
+        async def plan(ch):
+            """Read stage: diff + bot-side admin list + membership check"""
+            counts["scanned"] += 1
+            if counts["scanned"] == 1 or counts["scanned"] % 5 == 0:
+                await report_progress()
             
-            # --- PAUSE LOGIC ---
-            while len(ChannelManager.ACTIVE_SETUPS) > 0:
-                LOGGER.info(f"[SYNC-MAIN] ⏸️ Paused due to active setup...")
-                try: await status.edit(f"⏸️ **Paused...**\nPriority Setup Running.")
-                except: pass
-                await asyncio.sleep(5)
-            # -------------------
-
             chat_id = ch["channel_id"]
             current = set(ch.get("installed_bots", []))
-            wanted = set(Config.BOTS_TO_ADD)
-            
             to_add = list(wanted - current)
             to_remove = list(current - wanted)
             
-            # Skip if no changes needed
+            # Skip if no changes needed (changed since the count)
             if not to_add and not to_remove:
-                continue
+                job.outcome(chat_id, "in_sync")
+                return None
             
+            # Snapshot verified within ADMIN_SNAPSHOT_TTL: no Telegram call
+            snapshot = await admin_cache.current(chat_id) if to_add else None
+            existing_admins = snapshot.usernames() if snapshot else set()
+            is_member = await ChannelManager.check_helper_membership(chat_id)
+            return {
+                "channel": ch,
+                "current": current,
+                "to_add": to_add,
+                "to_remove": to_remove,
+                "existing_admins": existing_admins,
+                "is_member": is_member,
+            }
+        
+        async def mark_left(chat_id):
+            await ChannelManager.mark_helper_left(chat_id, reason="sync")
+        
+        async def apply(work):
+            """Write stage: join if needed, add/remove bots, schedule leave"""
+            ch = work["channel"]
+            chat_id = ch["channel_id"]
+            is_member = work["is_member"]
+            holds_slot = False
             try:
-                # Check if helper is in channel
-                is_member = await ChannelManager.check_helper_membership(chat_id)
-                
                 if not is_member:
+                    # Rejoin batch: wait for a free helper slot (freed by deferred leaves)
+                    if slots:
+                        await slots.acquire()
+                        holds_slot = True
                     LOGGER.info(f"Rejoining channel {chat_id} for sync")
                     await ChannelManager.add_helper_to_channel(chat_id)
-                    rejoined += 1
+                    counts["rejoined"] += 1
                     
                     # Wait 10s after joining
                     LOGGER.info("⏳ Waiting 10s after rejoin...")
                     await asyncio.sleep(10)
                 
                 # Sync bots
-                added_success, _ = await BotManager.process_bots(chat_id, "add", to_add)
-                removed_success, _ = await BotManager.process_bots(chat_id, "remove", to_remove)
+                added_success, _ = await BotManager.process_bots(
+                    chat_id, "add", work["to_add"], existing_admins=work["existing_admins"]
+                )
+                removed_success, _ = await BotManager.process_bots(chat_id, "remove", work["to_remove"])
                 
                 # Update database
-                new_state = list((current - set(removed_success)) | set(added_success))
+                new_state = list((work["current"] - set(removed_success)) | set(added_success))
                 await Database.update_channel_bots(chat_id, new_state)
                 
-                processed += 1
+                counts["processed"] += 1
+                job.outcome(chat_id, "rejoined" if not is_member else "updated")
+                await capacity.used(chat_id)
                 LOGGER.info(f"✅ Synced channel {chat_id}")
                 
-                # --- ADAPTIVE THROTTLING ---
-                bots_count = len(to_add)
-                if bots_count < 5:
-                    leave_delay = 30
-                elif 5 <= bots_count < 10:
-                    leave_delay = 25
-                elif 10 <= bots_count < 20:
-                    leave_delay = 20
-                else:
-                    leave_delay = 10
-                
+                # --- ADAPTIVE THROTTLING (leave runs in the background) ---
                 if not is_member:
-                    LOGGER.info(f"[SYNC] ⏳ Waiting {leave_delay}s before leaving (Batch size: {bots_count})...")
-                    await asyncio.sleep(leave_delay)
-                    try:
-                        await Clients.user_app.leave_chat(chat_id)
-                    except: pass
-                else:
-                    # Even if we were already member, we should wait if we did work
-                    await asyncio.sleep(Config.SYNC_CHANNEL_DELAY)
+                    pipeline.leave_later(
+                        chat_id, get_leave_delay(len(work["to_add"])),
+                        on_left=mark_left, on_done=slots.release if holds_slot else None
+                    )
+                    holds_slot = False
             
             except Exception as e:
-                errors += 1
+                if holds_slot:
+                    slots.release()
+                counts["errors"] += 1
+                job.outcome(chat_id, "error", str(e)[:200])
                 LOGGER.error(f"Sync error for {chat_id}: {e}")
                 
-                # Notify channel owner
-                try:
-                    await Clients.bot.send_message(
-                        ch["owner_id"],
-                        f"⚠️ **LinkerX Sync Failed**\n\n"
-                        f"🆔 Channel: `{chat_id}`\n"
-                        f"❌ Error: {str(e)[:100]}\n\n"
-                        f"Please run `/setup` inside the channel to fix."
-                    )
-                except Exception as notify_err:
-                    LOGGER.error(f"Failed to notify owner: {notify_err}")
+                # Notify channel owner (queued; several failures arrive as one digest)
+                await outbox.send(
+                    ch["owner_id"],
+                    f"⚠️ **LinkerX Sync Failed**\n\n"
+                    f"🆔 Channel: `{chat_id}`\n"
+                    f"❌ Error: {str(e)[:100]}\n\n"
+                    f"Please run `/setup` inside the channel to fix."
+                )
+        
+        async def on_pause(chat_id):
+            try: await status.edit(f"⏸️ **Waiting...**\nSetup running in `{chat_id}`.")
+            except: pass
+        
+        # --- MEMBERSHIP-AWARE ORDER ---
+        # 1. Channels the helper is already in (no join/leave churn).
+        # 2. Rejoins, batched within the free MAX_USER_CHANNELS capacity so
+        #    they don't force evictions. Cleanup meanwhile only evicts
+        #    channels already in sync (never ones this run still has to visit).
+        ChannelManager.SYNC_WANTED = wanted
+        slots = None
+        phase_names = [name for name, _ in SYNC_PHASES]
+        start = phase_names.index(job.phase) if job.phase in phase_names else 0
+        for phase, member in SYNC_PHASES[start:]:
+            await job.start_phase(phase)
+            if not member:
+                free = capacity.free
+                slots = asyncio.Semaphore(max(1, free))
+                LOGGER.info(f"Sync rejoin phase: batches of {max(1, free)} (free helper slots)")
             
-            # Update status on 1st channel, then every 5th channel
-            if idx == 1 or idx % 5 == 0:
-                try:
-                    await status.edit(
-                        f"🔄 **Syncing...**\n\n"
-                        f"Progress: {idx}/{total}\n"
-                        f"✅ Updated: {processed}\n"
-                        f"🔄 Rejoined: {rejoined}\n"
-                        f"❌ Errors: {errors}"
-                    )
-                except Exception as e:
-                    LOGGER.warning(f"Status update failed: {e}")
+            pipeline = SyncPipeline(plan, apply, name="SYNC-MAIN", on_pause=on_pause, job=job)
+            await pipeline.run(Database.iter_channels_needing_sync(wanted, after=job.cursor, member=member))
+        await job.save(status="done")
         
         # Final message
+        set_sync_progress(
+            "main", total=total, processed=total,
+            updated=counts["processed"], rejoined=counts["rejoined"], errors=counts["errors"]
+        )
         await status.edit(
             f"✅ **Sync Finished!**\n\n"
-            f"📊 Total Channels: {total}\n"
-            f"📝 Updated: {processed}\n"
-            f"🔄 Rejoined: {rejoined}\n"
-            f"⚠️ Errors: {errors}"
+            f"📊 Channels Needing Sync: {total}\n"
+            f"📝 Updated: {counts['processed']}\n"
+            f"🔄 Rejoined: {counts['rejoined']}\n"
+            f"⚠️ Errors: {counts['errors']}"
         )
-        LOGGER.info(f"Sync completed: {processed} updated, {errors} errors")
+        LOGGER.info(f"Sync completed: {counts['processed']} updated, {counts['errors']} errors")
     
     except Exception as e:
         LOGGER.error(f"Global sync error: {e}")
+        if job:
+            await job.save(status="failed")
         await status.edit(f"❌ **Sync Failed:** {str(e)}")
+    
+    finally:
+        ChannelManager.SYNC_WANTED = None
+
+SYNC_RUNNERS["main"] = run_main_sync
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    if hours:
+        return f"{hours}h {rest // 60}m"
+    return f"{rest // 60}m {rest % 60}s"
+
+@Clients.bot.on_message(filters.command("syncplan") & filters.user(Config.OWNER_ID))
+async def sync_plan_handler(client, message):
+    """
+    Dry-run /sync from Mongo alone (Owner only).
+    - `/syncplan` plans against the current BOTS_TO_ADD.
+    - `/syncplan @bot1 @bot2 ...` previews a proposed BOTS_TO_ADD.
+    """
+    proposed = [b.strip(",") for b in message.command[1:] if b.strip(",")]
+    wanted = Config.validate_bot_usernames(proposed) if proposed else Config.BOTS_TO_ADD
+    
+    status = await message.reply_text("🧮 **Planning sync...**")
+    try:
+        plan = await estimate_sync(wanted)
+    except Exception as e:
+        LOGGER.error(f"Sync plan error: {e}")
+        await status.edit(f"❌ **Plan Failed:** {str(e)}")
+        return
+    
+    if plan["channels"] == 0:
+        await status.edit("📭 All channels are already in sync with this bot list.")
+        return
+    
+    rpc_text = "\n".join(
+        f"• `{method}`: {n}" for method, n in sorted(plan["rpc"].items(), key=lambda x: -x[1])
+    )
+    budget_text = "\n".join(
+        f"• {name}: {format_duration(seconds)}" for name, seconds in plan["budgets"].items() if seconds
+    ) or "• Within burst limits"
+    
+    await status.edit(
+        f"🧮 **Sync Plan** ({'proposed' if proposed else 'current'} bots: {len(wanted)})\n\n"
+        f"📊 Channels to touch: `{plan['channels']}`\n"
+        f"➕ Need adds: `{plan['adds']}` ({plan['bots_added']} bots)\n"
+        f"➖ Need removes: `{plan['removes']}` ({plan['bots_removed']} bots)\n"
+        f"🔄 Helper rejoins: `{plan['rejoins']}`\n\n"
+        f"📡 **Estimated RPCs:**\n{rpc_text}\n\n"
+        f"⏱️ **Budget Drain:**\n{budget_text}\n\n"
+        f"🐢 Bottleneck: {plan['bottleneck']}\n"
+        f"⏳ **Estimated Duration: ~{format_duration(plan['eta'])}**"
+    )
@@ -18,8 +18,26 @@ class Config:
     
     # Safety & Limits
     SYNC_CHANNEL_DELAY = int(os.environ.get("SYNC_CHANNEL_DELAY", 15))
-    SYNC_ACTION_DELAY = 4
+    # Parallel bot-side reads (get_chat, admin lists) in the sync pipelines
+    SYNC_READ_CONCURRENCY = int(os.environ.get("SYNC_READ_CONCURRENCY", 5))
+    # Min seconds between helper joins/leaves (shared by setup, sync and archive)
+    HELPER_JOIN_INTERVAL = int(os.environ.get("HELPER_JOIN_INTERVAL", 10))
+    # Seconds a channel verified healthy by /syncarchive is skipped by later passes
+    ADMIN_SNAPSHOT_TTL = int(os.environ.get("ADMIN_SNAPSHOT_TTL", 12 * 3600))
     MAX_USER_CHANNELS = int(os.environ.get("MAX_USER_CHANNELS", 300))
+    # Which channel auto-cleanup evicts at the limit: oldest, lru, lfu or cost (see /evictsim)
+    EVICTION_POLICY = os.environ.get("EVICTION_POLICY", "oldest").lower()
+    # Free helper slots kept ready by evicting in the background while idle (0 = off)
+    CAPACITY_HEADROOM = int(os.environ.get("CAPACITY_HEADROOM", 5))
+    # Seconds between full sweeps of the helper's dialogs (membership index + drift fix)
+    MEMBERSHIP_SWEEP_INTERVAL = int(os.environ.get("MEMBERSHIP_SWEEP_INTERVAL", 6 * 3600))
+    
+    # Queue Workers
+    # Number of setup/archive tasks processed at the same time (different channels)
+    QUEUE_WORKERS = int(os.environ.get("QUEUE_WORKERS", 3))
+    # Shared helper account admin-write budget (add/promote/ban): tokens per second + burst size
+    HELPER_WRITE_RATE = float(os.environ.get("HELPER_WRITE_RATE", 0.25))
+    HELPER_WRITE_BURST = int(os.environ.get("HELPER_WRITE_BURST", 5))
     
     # Web Server
     PORT = int(os.environ.get("PORT", 8080))